@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Writes synthetic networks as stations, connections and lines CSV files in the same schema as the London ones, so the route finder
+can be tried at sizes the real data doesn't reach.
+usage: python benchmarks/generate.py [grid|radial|geometric] [stations] [prefix] [seed]
+writes prefix.stations.csv, prefix.connections.csv and prefix.lines.csv"""
+import csv
+import math
+import random
+import sys
+
+#the area the stations are spread over, in degrees
+minLat = 51.3
+latRange = 0.4
+minLong = -0.5
+longRange = 0.8
+#how fast trains go, in km per minute, for working out travel times from distances
+speed = 0.5
+#colours given to the lines in turn
+colours = ["B36305", "E32017", "FFD300", "00782A", "6950A1", "F3A9BB", "A0A5A9", "9B0056", "000000", "003688", "0098D4", "95CDBA"]
+#pieces that station names are made from, so the name index can be timed on names that look like place names
+syllables = ["ash", "bar", "brook", "bury", "by", "chester", "den", "field", "ford", "gate", "ham", "hol", "ing", "ket", "lan", "ley",
+             "mar", "more", "mouth", "stan", "ton", "well", "wick", "wood", "worth"]
+prefixes = ["North", "South", "East", "West", "Upper", "Lower", "Great", "Little", "Old", "New", "King's", "Queen's"]
+suffixes = ["Park", "Road", "Street", "Cross", "Green", "Hill", "Common", "Junction", "Central", "Parkway", "Broadway", "Lane"]
+
+
+#return a made up name for a station that isn't in taken, and add it to taken
+def stationName(rng, taken):
+    while True:
+        parts = ["".join(rng.choice(syllables) for i in range(rng.randint(2, 3))).capitalize()]
+        if rng.random() < 0.4:
+            parts.insert(0, rng.choice(prefixes))
+        if rng.random() < 0.6:
+            parts.append(rng.choice(suffixes))
+        name = " ".join(parts)
+        if name not in taken:
+            taken.add(name)
+            return name
+
+#return the travel time in whole minutes between two (lat, long) points, never less than one
+def travelTime(a, b):
+    dLat = (b[0] - a[0])*111.2
+    dLong = (b[1] - a[1])*111.2*math.cos(math.radians(a[0]))
+    return max(1, int(round(math.hypot(dLat, dLong)/speed)))
+
+#return a (lat, long) for a point in the unit square
+def toCoords(x, y):
+    return (minLat + y*latRange, minLong + x*longRange)
+
+
+#stations on a square grid. every row and every column is a line
+def gridLayout(count, rng):
+    side = max(2, int(math.ceil(math.sqrt(count))))
+    coords = []
+    for i in range(count):
+        row, col = divmod(i, side)
+        coords.append(toCoords((col + rng.uniform(-0.2, 0.2))/side, (row + rng.uniform(-0.2, 0.2))/side))
+    connections = []
+    for i in range(count):
+        row, col = divmod(i, side)
+        if col + 1 < side and i + 1 < count:
+            connections.append((i, i + 1, "row " + str(row)))
+        if i + side < count:
+            connections.append((i, i + side, "column " + str(col)))
+    return coords, connections
+
+#stations on rings around a centre, joined by spokes. every ring and every spoke is a line
+def radialLayout(count, rng):
+    spokes = max(3, int(math.ceil(math.sqrt(count))))
+    rings = max(1, int(math.ceil((count - 1)/spokes)))
+    coords = [toCoords(0.5, 0.5)]
+    connections = []
+    for i in range(1, count):
+        ring, spoke = divmod(i - 1, spokes)
+        angle = 2*math.pi*(spoke + rng.uniform(-0.1, 0.1))/spokes
+        radius = 0.5*(ring + 1)/rings
+        coords.append(toCoords(0.5 + radius*math.cos(angle), 0.5 + radius*math.sin(angle)))
+        #inwards along the spoke, to the centre from the first ring
+        connections.append((i, 0 if ring == 0 else i - spokes, "spoke " + str(spoke)))
+        #round the ring, closing it at the last spoke
+        if spoke > 0:
+            connections.append((i, i - 1, "ring " + str(ring)))
+        if spoke == spokes - 1:
+            connections.append((i, i - spokes + 1, "ring " + str(ring)))
+    return coords, connections
+
+#stations scattered at random, each joined to its nearest neighbours. connections are put on one of 64 lines by where they are
+def geometricLayout(count, rng, neighbours = 3):
+    points = [(rng.random(), rng.random()) for i in range(count)]
+    #bucket the points so the nearest neighbours are found without comparing every pair
+    side = max(1, int(math.sqrt(count/neighbours)))
+    cells = {}
+    for i, (x, y) in enumerate(points):
+        cells.setdefault((min(side - 1, int(x*side)), min(side - 1, int(y*side))), []).append(i)
+
+    connections = set()
+    for i, (x, y) in enumerate(points):
+        cx = min(side - 1, int(x*side))
+        cy = min(side - 1, int(y*side))
+        reach = 1
+        while True:
+            nearby = [j for dx in range(-reach, reach + 1) for dy in range(-reach, reach + 1) for j in cells.get((cx + dx, cy + dy), ()) if j != i]
+            if len(nearby) >= neighbours or reach > side:
+                break
+            reach += 1
+        nearby.sort(key = lambda j: (points[j][0] - x)**2 + (points[j][1] - y)**2)
+        for j in nearby[:neighbours]:
+            connections.add((min(i, j), max(i, j)))
+
+    coords = [toCoords(x, y) for x, y in points]
+    lines = []
+    for i, j in sorted(connections):
+        midX = (points[i][0] + points[j][0])/2
+        midY = (points[i][1] + points[j][1])/2
+        lines.append((i, j, "area " + str(min(7, int(midX*8))*8 + min(7, int(midY*8)))))
+    return coords, lines
+
+layouts = {"grid": gridLayout, "radial": radialLayout, "geometric": geometricLayout}
+
+
+#generate a network and write its three CSV files. returns (stations, connections)
+def writeNetwork(prefix, layout, count, seed = 1):
+    rng = random.Random(seed)
+    coords, connections = layouts[layout](count, rng)
+
+    with open(prefix + ".stations.csv", "w", newline = "") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "latitude", "longitude", "name", "display_name", "zone", "total_lines", "rail"])
+        taken = set()
+        for i, (lat, long) in enumerate(coords):
+            writer.writerow([i + 1, "%.6f" % lat, "%.6f" % long, stationName(rng, taken), "NULL", 1, 1, 0])
+
+    lineIds = {}
+    with open(prefix + ".connections.csv", "w", newline = "") as f:
+        writer = csv.writer(f)
+        writer.writerow(["station1", "station2", "line", "time"])
+        for i, j, name in connections:
+            line = lineIds.setdefault(name, len(lineIds) + 1)
+            writer.writerow([i + 1, j + 1, line, travelTime(coords[i], coords[j])])
+
+    with open(prefix + ".lines.csv", "w", newline = "") as f:
+        writer = csv.writer(f)
+        writer.writerow(["line", "name", "colour", "stripe"])
+        for name, line in lineIds.items():
+            writer.writerow([line, name.title(), colours[line % len(colours)], "NULL"])
+    return len(coords), len(connections)
+
+
+if __name__ == "__main__":
+    layout = sys.argv[1] if len(sys.argv) > 1 else "grid"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    prefix = sys.argv[3] if len(sys.argv) > 3 else layout + str(count)
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    stations, connections = writeNetwork(prefix, layout, count, seed)
+    print("wrote %s: %d stations, %d connections" % (prefix, stations, connections))
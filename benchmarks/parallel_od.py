@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Times Network.parallelODMatrix against the single process odMatrix on a grid network and prints the speedup for each pool size.
+usage: python benchmarks/parallel_od.py [grid side] [origins] [max workers]"""
+import os
+import random
+import sys
+import time
+
+#the engine is in the directory above this one
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import subway
+
+
+#build a side x side grid of stations with random travel times, alternating lines by row and column
+def gridNetwork(side, seed = 1):
+    rng = random.Random(seed)
+    network = subway.Network()
+    for row in range(side):
+        for col in range(side):
+            network.addStation(str(row*side + col), (51.4 + row*0.001, -0.6 + col*0.001), "Station " + str(row*side + col))
+    for row in range(side):
+        for col in range(side):
+            ID = str(row*side + col)
+            if col + 1 < side:
+                time = rng.randint(1, 5)
+                network.stations[ID].addConnection(str(row*side + col + 1), time, str(row % 4))
+                network.stations[str(row*side + col + 1)].addConnection(ID, time, str(row % 4))
+            if row + 1 < side:
+                time = rng.randint(1, 5)
+                network.stations[ID].addConnection(str((row + 1)*side + col), time, str(4 + col % 4))
+                network.stations[str((row + 1)*side + col)].addConnection(ID, time, str(4 + col % 4))
+    return network
+
+
+if __name__ == "__main__":
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    originCount = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    maxWorkers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    
+    network = gridNetwork(side)
+    network.getGraph()
+    rng = random.Random(2)
+    ids = list(network.stations)
+    origins = rng.sample(ids, originCount)
+    destinations = rng.sample(ids, min(len(ids), 500))
+    
+    #the route cache is emptied before each run so every run does the same searches
+    network.routeCache.clear()
+    start = time.perf_counter()
+    serial = list(network.odMatrix(origins, destinations))
+    serialTime = time.perf_counter() - start
+    print("stations: %d  origins: %d  destinations: %d" % (network.stationCount, len(origins), len(destinations)))
+    print("odMatrix (1 process): %.2fs" % serialTime)
+    
+    workers = 1
+    while workers <= maxWorkers:
+        network.routeCache.clear()
+        start = time.perf_counter()
+        parallel = list(network.parallelODMatrix(origins, destinations, workers = workers))
+        elapsed = time.perf_counter() - start
+        assert len(parallel) == len(serial)
+        print("parallelODMatrix (%d workers): %.2fs  speedup %.1fx" % (workers, elapsed, serialTime/elapsed))
+        workers *= 2
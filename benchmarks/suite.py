@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Times the route finder on synthetic networks and writes the results as JSON, so runs before and after a change can be compared.
+For each layout and size it times loading from CSV and from a snapshot, single queries in each search mode, a batch of queries,
+queries after closures, timetable queries, station name suggestions and building the map's render data without a GUI.
+usage: python benchmarks/suite.py [--sizes 1000 10000] [--layouts grid radial geometric] [--output results.json] [--compare old.json]"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+#the engine is in the directory above this one
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import subway
+import generate
+
+
+#return how long a function takes to run in seconds, and what it returned
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+#return the mean, median, 95th percentile and total of a list of times
+def summary(times):
+    ordered = sorted(times)
+    return {"mean": statistics.mean(ordered), "p50": ordered[len(ordered)//2], "p95": ordered[min(len(ordered) - 1, int(len(ordered)*0.95))], "total": sum(ordered), "count": len(ordered)}
+
+#empty every cache the network keeps, so each query does a full search
+def clearCaches(network):
+    network.routeCache.clear()
+    network.treeCache.clear()
+
+
+#load a network from its CSV files and build its graph, which is everything a first query would wait for
+def loadCSV(prefix):
+    network = subway.loadNetwork(prefix)
+    network.getGraph()
+    return network
+
+#time single route queries between random pairs of stations in one search mode, with the caches emptied before each
+def benchQueries(network, pairs, mode):
+    times = []
+    for origin, destination in pairs:
+        clearCaches(network)
+        elapsed, path = timed(network.findRoute, origin, destination, mode)
+        times.append(elapsed)
+    return summary(times)
+
+#time closing a line or a station and then finding a route with a search mode, then opening it again
+def benchClosures(network, pairs, rng, mode = "dijkstra"):
+    lineTimes = []
+    stationTimes = []
+    lines = list(network.getGraph().lineIds)
+    ids = list(network.stations)
+    for origin, destination in pairs:
+        line = rng.choice(lines)
+        start = time.perf_counter()
+        network.toggleLine(line)
+        network.findRoute(origin, destination, mode)
+        lineTimes.append(time.perf_counter() - start)
+        network.toggleLine(line)
+
+        station = network.stations[rng.choice(ids)]
+        start = time.perf_counter()
+        station.toggleActive()
+        network.findRoute(origin, destination, mode)
+        stationTimes.append(time.perf_counter() - start)
+        station.toggleActive()
+    return {"line": summary(lineTimes), "station": summary(stationTimes)}
+
+#time building a timetable for 07:00 to 10:00, then earliest arrival queries leaving at random times and profile queries over half an
+#hour, with the connection scan. trains run every 5 minutes, or less often on big networks so there are about a million connections at most
+def benchTimetable(network, pairs, rng):
+    graph = network.getGraph()
+    headway = max(300, 60*math.ceil(len(graph.targets)*3*3600/1000000/60))
+    periods = [(line, 7*3600, 10*3600, headway) for line in graph.lineIds]
+    build, timetable = timed(subway.Timetable.fromFrequencies, network, periods)
+    network.timetable = timetable
+    arrivalTimes = []
+    profileTimes = []
+    for origin, destination in pairs:
+        start = rng.randrange(7*3600, 8*3600)
+        arrivalTimes.append(timed(network.earliestArrival, origin, destination, start)[0])
+        profileTimes.append(timed(network.departureProfile, origin, destination, start, start + 1800)[0])
+    return {"build": build, "connections": timetable.size(), "headway": headway, "earliestArrival": summary(arrivalTimes), "profile": summary(profileTimes)}
+
+#time building the station name index, then suggesting stations after each letter of random names as they are typed, half of them
+#with a typing mistake, and resolving each whole name
+def benchNames(network, count, rng):
+    build, names = timed(network.getStationNames)
+    typed = []
+    for i in range(count):
+        name = network.stations[rng.choice(list(network.stations))].getName()
+        if rng.random() < 0.5:
+            k = rng.randrange(1, len(name))
+            name = name[:k] + rng.choice("aeiourstn") + name[k + 1:]
+        typed.append(name)
+    suggestTimes = [timed(names.suggest, name[:k])[0] for name in typed for k in range(1, len(name) + 1)]
+    resolveTimes = [timed(names.resolve, name)[0] for name in typed]
+    return {"build": build, "suggest": summary(suggestTimes), "resolve": summary(resolveTimes)}
+
+#time building the map's render data and placing every station on the canvas, without tkinter
+def benchRender(network):
+    elapsed, data = timed(subway.RenderData, network, 900, 500)
+    grid = subway.SpatialGrid(20)
+    start = time.perf_counter()
+    for i in range(len(data.ids)):
+        grid.insert(i, data.nlong[i], data.nlat[i], data.nlong[i], data.nlat[i])
+    for k, (line, points) in enumerate(data.polylines):
+        for a, b in zip(points, points[1:]):
+            grid.insert(k, data.nlong[a], data.nlat[a], data.nlong[b], data.nlat[b])
+    indexTime = time.perf_counter() - start
+    canvasTime, positions = timed(data.toCanvas, 4, 4, 1)
+    return {"renderData": elapsed, "spatialIndex": indexTime, "toCanvas": canvasTime, "polylines": len(data.polylines)}
+
+
+#run every benchmark on one generated network and return its results
+def benchNetwork(directory, layout, count, args):
+    prefix = os.path.join(directory, layout + str(count))
+    result = {"layout": layout, "requestedStations": count}
+    result["generate"], (stations, connections) = timed(generate.writeNetwork, prefix, layout, count, args.seed)
+    result["stations"] = stations
+    result["connections"] = connections
+
+    result["loadCSV"], network = timed(loadCSV, prefix)
+    snapshot = prefix + ".snapshot"
+    result["saveSnapshot"] = timed(network.save_snapshot, snapshot)[0]
+    result["loadSnapshot"], network = timed(subway.Network.load_snapshot, snapshot)
+
+    rng = random.Random(args.seed)
+    ids = list(network.stations)
+    pairs = [(rng.choice(ids), rng.choice(ids)) for i in range(args.queries)]
+    modes = ["dijkstra", "astar", "bidirectional"]
+    if args.hierarchy:
+        result["hierarchyBuild"] = timed(network.getHierarchy)[0]
+        modes.append("hierarchy")
+    result["query"] = {mode: benchQueries(network, pairs, mode) for mode in modes}
+
+    origins = rng.sample(ids, min(len(ids), args.batchOrigins))
+    destinations = rng.sample(ids, min(len(ids), args.batchDestinations))
+    clearCaches(network)
+    result["batch"] = {"origins": len(origins), "destinations": len(destinations), "time": timed(lambda: sum(1 for route in network.odMatrix(origins, destinations)))[0]}
+
+    result["closure"] = benchClosures(network, pairs[:args.closures], rng)
+    if args.hierarchy:
+        #closures re-customize the hierarchy's arcs, which is timed with its own random numbers so the other benchmarks are unchanged
+        result["hierarchyClosure"] = benchClosures(network, pairs[:args.closures], random.Random(args.seed), "hierarchy")
+    result["timetable"] = benchTimetable(network, pairs[:args.timetableQueries], rng)
+    result["names"] = benchNames(network, args.nameQueries, rng)
+    result["render"] = benchRender(network)
+    return result
+
+
+#flatten a result into {name: seconds} for comparing runs
+def flatten(result, prefix = ""):
+    flat = {}
+    for key, value in result.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, float):
+            flat[name] = value
+    return flat
+
+#print the timings that are more than threshold times slower or quicker than in an earlier run, and return how many are slower
+def compare(old, new, threshold):
+    previous = {(r["layout"], r["requestedStations"]): flatten(r) for r in old["results"]}
+    regressions = 0
+    compared = 0
+    for result in new["results"]:
+        key = (result["layout"], result["requestedStations"])
+        if key not in previous:
+            continue
+        for name, seconds in sorted(flatten(result).items()):
+            before = previous[key].get(name)
+            if not before:
+                continue
+            compared += 1
+            ratio = seconds/before
+            if ratio > threshold or ratio < 1/threshold:
+                regressions += ratio > threshold
+                print("%-10s %8d %-28s %10.6fs -> %10.6fs %6.2fx %s" % (key[0], key[1], name, before, seconds, ratio, "slower" if ratio > 1 else "quicker"))
+    print("%d of %d timings more than %.2fx slower" % (regressions, compared, threshold))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the route finder on synthetic networks.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [1000, 10000, 100000], help = "numbers of stations, up to 1000000")
+    parser.add_argument("--layouts", nargs = "+", default = list(generate.layouts), choices = list(generate.layouts))
+    parser.add_argument("--queries", type = int, default = 50, help = "single queries per search mode")
+    parser.add_argument("--closures", type = int, default = 10, help = "closures of a line and of a station to time")
+    parser.add_argument("--timetable-queries", dest = "timetableQueries", type = int, default = 10, help = "earliest arrival and profile queries to time")
+    parser.add_argument("--name-queries", dest = "nameQueries", type = int, default = 50, help = "station names to type out letter by letter")
+    parser.add_argument("--batch-origins", dest = "batchOrigins", type = int, default = 10)
+    parser.add_argument("--batch-destinations", dest = "batchDestinations", type = int, default = 100)
+    parser.add_argument("--hierarchy", action = "store_true", help = "also build and query the contraction hierarchy, which is slow to build on large networks")
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--data", help = "keep the generated networks in this directory instead of a temporary one")
+    parser.add_argument("--output", default = "benchmark-results.json", help = "where to write the results")
+    parser.add_argument("--compare", metavar = "OLD", help = "compare the results with an earlier results file")
+    parser.add_argument("--threshold", type = float, default = 1.2, help = "how many times slower counts as a regression when comparing")
+    args = parser.parse_args(argv)
+
+    directory = args.data or tempfile.mkdtemp(prefix = "subway-bench-")
+    os.makedirs(directory, exist_ok = True)
+    results = {"python": platform.python_version(), "platform": platform.platform(), "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": []}
+    try:
+        for count in args.sizes:
+            for layout in args.layouts:
+                result = benchNetwork(directory, layout, count, args)
+                results["results"].append(result)
+                print("%-10s %8d stations  load %.3fs  snapshot %.3fs  dijkstra p50 %.2fms  render %.3fs" % (layout, result["stations"], result["loadCSV"], result["loadSnapshot"], result["query"]["dijkstra"]["p50"]*1000, result["render"]["renderData"]))
+                if args.hierarchy:
+                    print("%-10s %8d stations  hierarchy build %.3fs  query p50 %.2fms  line closure p50 %.3fs  station closure p50 %.3fs" % (layout, result["stations"], result["hierarchyBuild"], result["query"]["hierarchy"]["p50"]*1000, result["hierarchyClosure"]["line"]["p50"], result["hierarchyClosure"]["station"]["p50"]))
+    finally:
+        if args.data is None:
+            shutil.rmtree(directory, ignore_errors = True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent = 1)
+    print("results written to " + args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            return 1 if compare(json.load(f), results, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""A JSON over HTTP route service around a Network, using asyncio. Searches run in an executor so the event loop keeps answering,
+identical queries that arrive while one is being searched share its result, and closures can be changed while it runs.
+usage: python server.py [--network london] [--host 127.0.0.1] [--port 8642] [--workers 0] [--max-pending 64]
+
+    GET  /route?from=STATION&to=STATION[&mode=dijkstra]   find a route, stations by name or ID
+    GET  /stations?q=TEXT[&limit=10]                      stations whose names start with, or nearly start with, what was typed
+    POST /stations/ID/toggle                              open or close a station, like Station.toggleActive
+    POST /lines/LINE/toggle                               open or close a line, like Network.toggleLine
+    POST /lines/open-all                                  open every line, like Network.openAllLines
+    GET  /closures                                        the closed lines and stations
+    GET  /stats                                           counters for the service and the route cache, and query timings if --instrument is given"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import subway
+
+modes = ("dijkstra", "astar", "bidirectional", "hierarchy")
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+#state of a worker process, which has its own copy of the network loaded from a snapshot
+routeWorker = {}
+
+#load the network in a new worker process. the snapshot is memory-mapped, so the workers share its arrays
+def startRouteWorker(path):
+    routeWorker["network"] = subway.Network.load_snapshot(path)
+    routeWorker["version"] = None
+    routeWorker["closedStations"] = {ID for ID, station in routeWorker["network"].stations.items() if not station.isActive()}
+
+#find a route in a worker process, first bringing its copy of the network's closures up to date if they have changed since its last search
+def solveRoute(origin, destination, mode, version, closedLines, closedStations):
+    network = routeWorker["network"]
+    if routeWorker["version"] != version:
+        network.closedLines[:] = closedLines
+        network.closuresChanged()
+        closedStations = set(closedStations)
+        for ID in routeWorker["closedStations"] ^ closedStations:
+            network.stations[ID].toggleActive()
+        routeWorker["closedStations"] = closedStations
+        routeWorker["version"] = version
+    return network.findRoute(origin, destination, mode)
+
+
+class RouteServer:
+    """Answers route queries for a network over HTTP. With workers set to 0 searches run on one thread, which closures also go through
+    so a search never sees them half made. Otherwise a pool of that many processes searches copies of the network loaded from a snapshot,
+    and each search is sent the closures it should use. Concurrent queries for the same (origin, destination, mode, closure version)
+    are searched once, and when maxPending searches are already waiting new ones are turned away with a 503"""
+    def __init__(self, network, workers = 0, maxPending = 64):
+        self.network = network
+        self.workers = workers
+        self.maxPending = maxPending
+        #building the graph counts as a closure change, so it is built before any versions are handed out
+        network.getGraph()
+        #the station name index is built now, rather than by the first request that needs it
+        network.getStationNames()
+        #searches in progress by (origin, destination, mode, closure version)
+        self.inFlight = {}
+        self.counters = {"requests": 0, "routes": 0, "searches": 0, "coalesced": 0, "cacheHits": 0, "rejected": 0}
+        self.snapshot = None
+        #the closed stations sent to worker processes, worked out once for each closure version
+        self.closedStations = (None, ())
+        if workers:
+            handle, self.snapshot = tempfile.mkstemp(suffix = ".snapshot")
+            os.close(handle)
+            network.save_snapshot(self.snapshot)
+            #workers are spawned rather than forked, so they don't inherit the sockets of connections open when they start and keep them from closing
+            self.executor = ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context("spawn"),
+                                                initializer = startRouteWorker, initargs = (self.snapshot,))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers = 1)
+        self.server = None
+
+    #start listening. port 0 picks a free port, which is returned
+    async def start(self, host = "127.0.0.1", port = 8642):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    #stop listening and shut down the executor
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait = True)
+        if self.snapshot is not None:
+            os.remove(self.snapshot)
+            self.snapshot = None
+
+    #run a function on the thread that searches, so it doesn't change the network under a search. in process mode the network
+    #in this process is never searched, so the function is just called
+    async def onSearchThread(self, function, *args):
+        if self.workers:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    #return the ID of a station given as a name or ID, or None if there's no such station
+    def stationID(self, station):
+        return self.network.findStation(station)
+
+    #suggest stations for what has been typed. returns (status, response)
+    def stations(self, text, limit):
+        try:
+            limit = int(limit)
+        except ValueError:
+            return 400, {"error": "limit must be a number"}
+        if limit < 1:
+            return 400, {"error": "limit must be at least 1"}
+        suggestions = self.network.suggestStations(text, min(limit, 100))
+        return 200, {"stations": [{"name": name, "id": ID} for name, ID in suggestions]}
+
+    #find a route, sharing the search with any identical query already being searched. returns (status, response)
+    async def route(self, origin, destination, mode):
+        self.counters["routes"] += 1
+        if mode not in modes:
+            return 400, {"error": "unknown mode " + repr(mode)}
+        originID = self.stationID(origin)
+        destinationID = self.stationID(destination)
+        error = self.network.routeError(originID or origin, destinationID or destination)
+        if error is not None:
+            return (400 if error[0][0] == "Destination or starting station not found." else 404), {"error": error[0][0]}
+
+        version = self.network.closureVersion
+        key = (originID, destinationID, mode, version)
+        found, path = self.network.routeCache.lookup((originID, destinationID, version))
+        if found:
+            self.counters["cacheHits"] += 1
+        else:
+            future = self.inFlight.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+            else:
+                if len(self.inFlight) >= self.maxPending:
+                    self.counters["rejected"] += 1
+                    return 503, {"error": "too many searches waiting, try again shortly"}
+                future = asyncio.ensure_future(self.search(originID, destinationID, mode, version))
+                self.inFlight[key] = future
+                future.add_done_callback(lambda done: self.inFlight.pop(key, None))
+            #shielded so a client hanging up doesn't cancel a search other clients are waiting for
+            path = await asyncio.shield(future)
+
+        response = {"origin": originID, "destination": destinationID, "mode": mode, "closureVersion": version}
+        if path is None:
+            response["error"] = "Route not reachable. Check closures"
+            return 404, response
+        response["time"] = path[1]
+        response["route"] = list(path[0])
+        response["names"] = [self.network.stations[ID].getName() for ID in path[0]]
+        return 200, response
+
+    #search for a route in the executor and keep the result in the network's route cache
+    async def search(self, origin, destination, mode, version):
+        self.counters["searches"] += 1
+        loop = asyncio.get_running_loop()
+        if not self.workers:
+            #findRoute keeps the result in the route cache itself
+            return await loop.run_in_executor(self.executor, self.network.findRoute, origin, destination, mode)
+        if self.closedStations[0] != version:
+            self.closedStations = (version, tuple(ID for ID, station in self.network.stations.items() if not station.isActive()))
+        path = await loop.run_in_executor(self.executor, solveRoute, origin, destination, mode, version, tuple(self.network.closedLines), self.closedStations[1])
+        if version == self.network.closureVersion:
+            self.network.routeCache.store((origin, destination, version), path)
+        return path
+
+    #open or close a station. returns (status, response)
+    async def toggleStation(self, station):
+        ID = self.stationID(station)
+        if ID is None:
+            return 404, {"error": "unknown station " + repr(station)}
+        await self.onSearchThread(self.network.stations[ID].toggleActive)
+        return 200, {"station": ID, "active": self.network.stations[ID].isActive(), "closureVersion": self.network.closureVersion}
+
+    #open or close a line, given by name or ID. returns (status, response)
+    async def toggleLine(self, line):
+        line = self.network.lines.get(line, line)
+        if line not in self.network.lines.values() and line not in self.network.getGraph().lineCodes:
+            return 404, {"error": "unknown line " + repr(line)}
+        closed = await self.onSearchThread(self.network.toggleLine, line)
+        return 200, {"line": line, "closed": closed, "closureVersion": self.network.closureVersion}
+
+    #return the closed lines and stations
+    def closures(self):
+        closedStations = [ID for ID, station in self.network.stations.items() if not station.isActive()]
+        return {"closedLines": list(self.network.closedLines), "closedStations": closedStations, "closureVersion": self.network.closureVersion}
+
+    #work out the response to a request. returns (status, response)
+    async def dispatch(self, method, target):
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        if parts == ["route"]:
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            query = parse_qs(url.query)
+            if "from" not in query or "to" not in query:
+                return 400, {"error": "give the stations as from and to"}
+            return await self.route(query["from"][0], query["to"][0], query.get("mode", ["dijkstra"])[0])
+        if parts == ["stations"]:
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            query = parse_qs(url.query)
+            if "q" not in query:
+                return 400, {"error": "give what was typed as q"}
+            return self.stations(query["q"][0], query.get("limit", ["10"])[0])
+        if parts == ["closures"] or parts == ["stats"]:
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            if parts == ["closures"]:
+                return 200, self.closures()
+            return 200, dict(self.counters, pending = len(self.inFlight), routeCache = self.network.routeCache.stats(), queries = self.network.queryStats())
+        if parts == ["lines", "open-all"] or (len(parts) == 3 and parts[0] in ("stations", "lines") and parts[2] == "toggle"):
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            if parts[1] == "open-all":
+                await self.onSearchThread(self.network.openAllLines)
+                return 200, self.closures()
+            if parts[0] == "stations":
+                return await self.toggleStation(parts[1])
+            return await self.toggleLine(parts[1])
+        return 404, {"error": "no such endpoint " + url.path}
+
+    #answer the HTTP requests on one connection, keeping it open between requests unless the client asks otherwise
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                #request bodies aren't used, but they are read so the next request on the connection starts in the right place
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                self.counters["requests"] += 1
+                words = requestLine.decode("latin-1").split()
+                if len(words) != 3:
+                    status, response = 400, {"error": "malformed request line"}
+                    keepAlive = False
+                else:
+                    method, target, version = words
+                    try:
+                        status, response = await self.dispatch(method.upper(), target)
+                    except Exception as error:
+                        #a search that failed, say because a worker process died, is reported rather than dropping the connection
+                        status, response = 500, {"error": "%s: %s" % (type(error).__name__, error)}
+                    keepAlive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                body = json.dumps(response).encode("utf-8")
+                head = ["HTTP/1.1 %d %s" % (status, reasons[status]), "Content-Type: application/json", "Content-Length: " + str(len(body))]
+                if status == 503:
+                    head.append("Retry-After: 1")
+                head.append("Connection: " + ("keep-alive" if keepAlive else "close"))
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(network, host, port, workers, maxPending):
+    server = RouteServer(network, workers, maxPending)
+    port = await server.start(host, port)
+    print("serving routes on http://%s:%d" % (host, port))
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Serve routes as JSON over HTTP.")
+    parser.add_argument("--network", default = "london", metavar = "PREFIX", help = "CSV prefix or snapshot file to load (default: london)")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8642)
+    parser.add_argument("--workers", type = int, default = 0, help = "search in this many processes, or on one thread if 0")
+    parser.add_argument("--max-pending", dest = "maxPending", type = int, default = 64, help = "searches that can wait before new ones are turned away")
+    parser.add_argument("--instrument", action = "store_true", help = "time every search and report the timings by mode under /stats")
+    parser.add_argument("--profile-slowest", dest = "profileSlowest", type = int, default = 0, metavar = "N", help = "with --instrument, keep a cProfile of the N slowest searches")
+    parser.add_argument("--dump-stats", dest = "dumpStats", metavar = "FILE", help = "with --instrument, append the timings to FILE as JSON once a minute")
+    args = parser.parse_args(argv)
+    if args.workers and args.instrument:
+        parser.error("--instrument times searches made in this process, so it can't be used with --workers")
+    if (args.profileSlowest or args.dumpStats) and not args.instrument:
+        parser.error("--profile-slowest and --dump-stats need --instrument")
+    network = subway.loadNetwork(args.network)
+    if args.instrument:
+        stats = network.enableInstrumentation(args.profileSlowest)
+        if args.dumpStats is not None:
+            stats.startDump(args.dumpStats)
+    try:
+        asyncio.run(serve(network, args.host, args.port, args.workers, args.maxPending))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,156 +1,71 @@
 # -*- coding: utf-8 -*-
 #import libraries
-from collections import defaultdict
 import tkinter as tk
-import csv
-import copy # used as a shortcut for creating a copy of the station dictionary to mutate for route finding
 import datetime # used to give the user more detailed information when they save their route
-#///////////////////////////////////CLASSES//////////////////////////////////////////////
-
-
-class CSV:
-    """takes a CSV file and stores its data in a dictionary of lists"""
-    #read a csv file into a dictionary
-    def __init__(self, fileName):
-        self.CSVDict = defaultdict(list)
-        for record in csv.DictReader(open(fileName)):
-              for key, val in record.items():   
-                   self.CSVDict[key].append(val)
-                   
-   #to be used to add unique IDs to CSV files that have none                
-    def addCol(self, key, column):
-       self.CSVDict[key] = column
-       
-    #return a column from the csv file as a list    
-    def getCol(self, colName):
-        return self.CSVDict[colName]
-       
-
-
+import queue
+import threading # lets the GUI find routes without freezing the window
+from subway import RenderData, RouteCancelled, SpatialGrid, loadNetwork, stationID # the route finding engine
+#///////////////////////////GUI PROGRAMMING//////////////////////////////
 
-class Station:
-    """Represents one node on the network"""
-    def __init__(self, coords, name):
-        self.coords = coords
-        self.name = name
-        self.connections = []
-        self.active = True
-        
-    #add a connection to a neighbour    
-    def addConnection(self,ID, distance, line):
-        self.connections.append((ID, distance, line))
-    
-    #remove a specified neighbor  - only used by the copy created for routefinding   
-    def removeConnection(self,connection):
-        self.connections.remove(connection)
+class RouteWorker:
+    """Finds routes on a background thread, so a long search never freezes the window. Only the newest query is wanted:
+    submitting another query, or any change to the closures, cancels a query that is still waiting or searching"""
+    def __init__(self, network):
+        self.network = network
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.generation = 0
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
     
-    #return the station's coordinates
-    def getCoords(self):
-        return self.coords
+    #queue a route query and return its generation number, which poll uses to match it to its result
+    def submit(self, ID1, ID2, mode = "dijkstra"):
+        #building the graph counts as a closure change, so build it first or the query would cancel itself
+        self.network.getGraph()
+        self.cancel()
+        self.requests.put((self.generation, self.network.closureVersion, ID1, ID2, mode))
+        return self.generation
     
-    #return the station's name
-    def getName(self):
-        return self.name
+    #cancel the query that is waiting or searching, if there is one. called before a new query is queued and before the closures change
+    def cancel(self):
+        self.generation += 1
     
-    #return the station's list of connections
-    def getConnections(self):
-        return self.connections
+    #the number of stations the current search has settled, to show its progress
+    def progress(self):
+        return self.network.lastSettled
     
-    #return the active state of the station
-    def isActive(self):
-        return self.active
+    #return (generation, closure version, result) for the newest query that has finished, or None if none has. the closure version is
+    #the network's closureVersion when the query was submitted. result is what findRoute returned, a RouteCancelled if the query was
+    #cancelled, or any other exception the search raised
+    def poll(self):
+        finished = None
+        while True:
+            try:
+                finished = self.results.get_nowait()
+            except queue.Empty:
+                return finished
     
-    #toggle the station
-    def toggleActive(self):
-            self.active = not self.active
-
-
-
-
-"""A network composed of Stations"""
-class Network:
-    def __init__(self):
-        self.stations = {}
-        self.stationCount = 0
-        self.closedLines = []
-        self.lines = {}
-     
-    def addStation(self, ID, coords, name):
-        self.stations[ID] = Station(coords, name)
-        self.stationCount += 1
-        
-    #run Djikstra's Algorithm to find the fastest route between stwo given stations
-    def findRoute(self, ID1, ID2):
-        shortestDistance = {}
-        predecessor = {}
-        self.unVisited = self.stations.copy() #didn't realise python treats unVisited as a pointer to self.stations until I ran the algorithm with the GUI and all my stations disappeared. Lessons were learned.
-        self.stationsCopy = copy.deepcopy(self.unVisited)
-        infinity = 9999999999
-        route = []
-  
-        try:
-            if not (self.stations[ID1].isActive()):
-                route.insert(0, "Starting station is closed, please choose \nanother station to begin your journey from")
-                return(route, 0)
-            if not(self.stations[ID2].isActive()):
-                route.insert(0,"Destination station is closed, \nplease choose another")
-                return(route, 0)
-        except KeyError:
-            route.insert(0,"Destination or starting station not found.")
-            return(route, 0)
-            
-            
-        #store all nodes as unvisited, store all nodes' distances as infinity
-        for item in self.unVisited:
-            shortestDistance[item] = infinity
-            
-        shortestDistance[ID1] = 0
-        
-        #remove all connections on closed lines from the copy dictionary
-        for item in self.stationsCopy:
-            for connection in self.stationsCopy[item].getConnections():
-                    if (connection[2] in self.closedLines):
-                        self.stationsCopy[item].removeConnection(connection)
-        
-        #main body of the Dijkstra's algorithm. probably 90% identical to most of the other assignments, but it works.
-        while self.unVisited:
-            minNode = None
-            for node in self.unVisited:
-                if minNode is None:
-                    minNode = node
-                elif (shortestDistance[node] < shortestDistance[minNode]):
-                    minNode = node
-            
-            for connection in self.stationsCopy[minNode].getConnections():
-                if (connection[2] in self.closedLines):
-                    self.stationsCopy[minNode].removeConnection(connection)
-            
-            for connection in self.stationsCopy[minNode].getConnections():
-                if (int(connection[1]) + shortestDistance[minNode] < shortestDistance[connection[0]]):
-                    shortestDistance[connection[0]] = int(connection[1]) + shortestDistance[minNode]
-                    predecessor[connection[0]] = minNode
-            self.unVisited.pop(minNode)
-        #end of Dijkstra's
-
-        #create and return the list of stations in the route
-        currentNode = ID2
-        while (currentNode != ID1):
+    #answer queries until the program exits. queries that have already been replaced by a newer one are skipped without searching
+    def run(self):
+        while True:
+            request = self.requests.get()
+            while not self.requests.empty():
+                request = self.requests.get_nowait()
+            generation, version, ID1, ID2, mode = request
+            cancelled = lambda: generation != self.generation or version != self.network.closureVersion
             try:
-                route.insert(0, currentNode)
-                currentNode = predecessor[currentNode]
-            except KeyError:
-                
-                break
-        route.insert(0, ID1)
-        if(shortestDistance[ID2] != infinity):
-            return(route, shortestDistance[ID2])
-
+                if cancelled():
+                    raise RouteCancelled()
+                result = self.network.findRoute(ID1, ID2, mode, cancelled)
+            except Exception as error:
+                result = error
+            self.results.put((generation, version, result))
 
-#///////////////////////////GUI PROGRAMMING//////////////////////////////
 
 class GUI:
-    """Contains all of the GUI objects and the interface methods"""
-    def __init__(self):
+    """Contains all of the GUI objects and the interface methods, for a network of stations"""
+    def __init__(self, network):
+        self.network = network
         self.zoom = 1
         self.cwidth = 900
         self.cheight = 500
@@ -163,6 +78,22 @@ class GUI:
         self.routeList = []
         self.routeLength = 0
         
+        #routes are found on a background thread. routeQuery is the generation of the query being waited for, or None
+        self.routeWorker = RouteWorker(network)
+        self.routeQuery = None
+        self.pollInterval = 50
+        
+        #the precomputed map positions and spatial indexes of the stations and connections, built on the first draw
+        self.renderData = None
+        self.stationGrid = None
+        self.connectionGrid = None
+        self.gridCellSize = 20
+        #the on-screen spacing in pixels that station squares and names are thinned out to
+        self.stationSpacing = 6
+        self.labelSpacing = 80
+        #maps with at most this many stations show all of them at every zoom, so none are hidden that could still be told apart and clicked
+        self.fullDetail = 2000
+        
         #/////////////CONSTRUCT THE LAYOUT////////////   
         self.window = tk.Tk()
         self.window.title("London Underground")
@@ -187,7 +118,7 @@ class GUI:
         
         self.option = tk.StringVar(self.window) 
                         
-        self.choices = linesCSV.getCol("name")                 
+        self.choices = list(self.network.lines)
         self.option.set("Bakerloo Line")                           
         self.lineMenu = tk.OptionMenu(self.closuresFrame, self.option,  *self.choices,  command = self.colourShow)
         self.lineMenu.config(bg = "#d1e6fc")
@@ -234,13 +165,24 @@ class GUI:
         self.routeFrame.grid(row=0, column=2) 
         
         
-        self.choices = {}
-        for item in theNetwork.stations:
-            k = theNetwork.stations[item].getName()
-            v = item
-            self.choices[k] = v
         self.inputOne = tk.Entry(self.routeFrame, width = 28)
         self.inputTwo = tk.Entry(self.routeFrame, width = 28)
+        #the stations matching what is being typed, shown under whichever entry it is typed in
+        self.stationNames = self.network.getStationNames()
+        self.suggestions = tk.Listbox(self.routeFrame, height = 6, activestyle = "none", bg = "#d1e6fc")
+        self.suggesting = None
+        for entry in (self.inputOne, self.inputTwo):
+            entry.bind("<KeyRelease>", self.suggest)
+            entry.bind("<Down>", self.enterSuggestions)
+            entry.bind("<Return>", self.chooseFirst)
+            entry.bind("<Escape>", lambda event: self.hideSuggestions())
+            entry.bind("<FocusOut>", lambda event: self.window.after(200, self.hideUnfocused))
+        self.suggestions.bind("<ButtonRelease-1>", lambda event: self.chooseSuggestion())
+        self.suggestions.bind("<Return>", lambda event: self.chooseSuggestion())
+        self.suggestions.bind("<Up>", lambda event: self.moveSuggestion(-1))
+        self.suggestions.bind("<Down>", lambda event: self.moveSuggestion(1))
+        self.suggestions.bind("<Escape>", lambda event: self.hideSuggestions(True))
+        self.suggestions.bind("<FocusOut>", lambda event: self.window.after(200, self.hideUnfocused))
         self.routeButton = tk.Button(self.routeFrame, text="GO", width = 15, bg = "#d1e6fc", command = self.showRoute)
         self.swapButton = tk.Button(self.routeFrame, text="<>", width = 5, height = 1, bg = "#d1e6fc", command = self.inputSwap)
         self.saveButton = tk.Button(self.routeFrame, text = "Save Route", width = 50, height = 3, bg = "#d1e6fc", command = self.saveRoute)
@@ -262,44 +204,47 @@ class GUI:
         #///////////END OF LAYOUT CONSTRUCTION//////////////
 
 
-    #toggle stations on click
+    #toggle stations on click. the click is turned back into map coordinates and only the stations in the grid cells around it are checked
     def callback(self, event):
+        mapX = event.x/self.zoom - self.xOffset
+        mapY = self.cheight + self.yOffset - event.y/self.zoom
+        size = self.stationSize
+        nearby = sorted(self.stationGrid.query(mapX - size, mapY - size, mapX + size, mapY + size))
+        positions = self.renderData.positions(nearby, self.xOffset, self.yOffset, self.zoom)
+        maxTier = self.stationTier()
     
-        for item in theNetwork.stations:
-            crds = self.normalise(theNetwork.stations[item].getCoords())  
-        #print(crds)
-            x1 = (((crds[1])-self.stationSize) + self.xOffset)*self.zoom
-            y1 = ((self.cheight - ((crds[0])-self.stationSize)) + self.yOffset)*self.zoom
-            x2 = (((crds[1])+self.stationSize) + self.xOffset)*self.zoom
-            y2 = ((self.cheight - ((crds[0])+self.stationSize)) + self.yOffset)*self.zoom
-            if (event.x > x1 and event.x < x2 and event.y < y1 and event.y > y2):
-                theNetwork.stations[item].toggleActive()
-                stationN = theNetwork.stations[item].getName()
-                if (theNetwork.stations[item].isActive()):
+        for i in nearby:
+            #stations thinned out at this zoom can't be clicked
+            if self.renderData.tiers[i] > maxTier:
+                continue
+            item = self.renderData.ids[i]
+            box = self.stationBox(*positions[i])[0]
+            if (event.x > box[0] and event.x < box[2] and event.y < box[1] and event.y > box[3]):
+                self.routeWorker.cancel()
+                self.network.stations[item].toggleActive()
+                stationN = self.network.stations[item].getName()
+                if (self.network.stations[item].isActive()):
                     self.log.configure(state='normal')
                     self.log.insert(tk.END, (stationN + " has been opened \n"))
                     self.log.configure(state='disabled')
-                if not (theNetwork.stations[item].isActive()):
+                if not (self.network.stations[item].isActive()):
                     self.log.configure(state='normal')
                     self.log.insert(tk.END, (stationN + " has been closed \n"))
                     self.log.configure(state='disabled')
                 
-                self.draw()
+                self.canvas.itemconfig("station" + item, fill = self.stationColour(item))
     
     #navigate around the map
     def move(self, event, direction):
         if (direction == "right"):
             self.xOffset -= (10/self.zoom)
-            self.draw()
         if (direction == "left"):
             self.xOffset += (10/self.zoom)
-            self.draw()
         if (direction == "down"):
             self.yOffset -= (10/self.zoom)
-            self.draw()
         if (direction == "up"):
             self.yOffset += (10/self.zoom)
-            self.draw()
+        self.updateView()
             
             
     #TODO: fix the zoom so it zooms to the centre        
@@ -333,41 +278,139 @@ class GUI:
                 self.stationSize = 1
             if (self.zoom > 10 and self.zoom > 50):
                 self.stationSize = 0.5
-            self.draw()
-    
-    #take coordinates of a station and normalise them for drawing on the canvas
-    def normalise(self, crds):
-        #nlat =   ((crds[0]-min)/(max-min))*width
-        nlat =   int(((crds[0]-51.4022)/0.303)*self.cheight)
-        #1 has to be added to make all the values positive.
-        nlong = int((((crds[1]+1)-0.389)/0.862)*self.cwidth)
-        return (nlat, nlong)    
+            self.updateView()
     
     #Convert the two text inputs to station IDs if possible, then pass those to the Network's findRoute function and output the result to the output box
+    #names can be mistyped or shortened, as long as they only match one station, and are then replaced with the station's full name
     def showRoute(self):
-        self.routeOutput.configure(state='normal')
-        self.routeOutput.delete(1.0,tk.END)
-        SID1 = ""
-        SID2 = ""
-        routeSave = []
-        try:
-            SID1 = self.choices[self.inputOne.get()]
-            SID2 = self.choices[self.inputTwo.get()]
+        self.hideSuggestions()
+        SID1 = stationID(self.network, self.inputOne.get())
+        SID2 = stationID(self.network, self.inputTwo.get())
+        for entry, ID in ((self.inputOne, SID1), (self.inputTwo, SID2)):
+            if ID in self.network.stations:
+                entry.delete(0, tk.END)
+                entry.insert(0, self.network.stations[ID].getName())
+        if SID1 in self.network.stations and SID2 in self.network.stations:
             self.log.configure(state='normal')
             self.log.insert(tk.END, ( "Route calculated \n"))
             self.log.configure(state='disabled')
-        except KeyError:
-            print("")
-            
-        path = theNetwork.findRoute(SID1, SID2)
+        
+        #hand the search to the route worker, replacing any search still running, and check back for the result
+        waiting = self.routeQuery is not None
+        self.routeQuery = self.routeWorker.submit(SID1, SID2)
+        self.showProgress("Finding route...")
+        if not waiting:
+            self.window.after(self.pollInterval, self.pollRoute)
+    
+    #show the stations matching what has been typed in an entry in a list under it, or hide the list if none match
+    def suggest(self, event):
+        if event.keysym in ("Up", "Down", "Left", "Right", "Return", "Escape", "Tab"):
+            return
+        matches = self.stationNames.suggest(event.widget.get(), 6)
+        if not matches or (len(matches) == 1 and matches[0][0] == event.widget.get()):
+            self.hideSuggestions()
+            return
+        self.suggesting = event.widget
+        self.suggestions.delete(0, tk.END)
+        for name, ID in matches:
+            self.suggestions.insert(tk.END, name)
+        self.suggestions.configure(height = len(matches))
+        self.suggestions.place(in_ = event.widget, relx = 0, rely = 1, relwidth = 1)
+        self.suggestions.lift()
+    
+    #move the highlighted suggestion up or down, going from the entry into the list and back out of the top of it.
+    #returns "break" so the arrow keys don't also move the map
+    def moveSuggestion(self, step):
+        if self.suggesting is None:
+            return "break"
+        chosen = self.suggestions.curselection()
+        index = chosen[0] + step if chosen and self.window.focus_get() is self.suggestions else 0
+        self.suggestions.selection_clear(0, tk.END)
+        if index < 0:
+            self.suggesting.focus_set()
+            return "break"
+        index = min(index, self.suggestions.size() - 1)
+        self.suggestions.focus_set()
+        self.suggestions.selection_set(index)
+        self.suggestions.activate(index)
+        return "break"
+    
+    #move from an entry into its suggestions with the down arrow. if they aren't showing, the arrow moves the map as usual
+    def enterSuggestions(self, event):
+        if self.suggesting is event.widget:
+            return self.moveSuggestion(1)
+    
+    #put the first suggestion in the entry when return is pressed in it
+    def chooseFirst(self, event):
+        if self.suggesting is event.widget:
+            self.suggestions.selection_clear(0, tk.END)
+            self.suggestions.selection_set(0)
+            self.chooseSuggestion()
+    
+    #put the highlighted suggestion in the entry it was for
+    def chooseSuggestion(self):
+        chosen = self.suggestions.curselection()
+        entry = self.suggesting
+        if entry is None or not chosen:
+            return
+        entry.delete(0, tk.END)
+        entry.insert(0, self.suggestions.get(chosen[0]))
+        self.hideSuggestions(True)
+    
+    #hide the suggestions, and put the focus back in their entry if refocus is True
+    def hideSuggestions(self, refocus = False):
+        if self.suggesting is not None and refocus:
+            self.suggesting.focus_set()
+            self.suggesting.icursor(tk.END)
+        self.suggestions.place_forget()
+        self.suggesting = None
+    
+    #hide the suggestions once neither they nor their entry have the focus, such as after clicking somewhere else
+    def hideUnfocused(self):
+        if self.suggesting is not None and self.window.focus_get() not in (self.suggesting, self.suggestions):
+            self.hideSuggestions()
+    
+    #show a message in the route output while a route is being found
+    def showProgress(self, message):
+        self.routeOutput.configure(state='normal')
+        self.routeOutput.delete(1.0,tk.END)
+        self.routeOutput.insert(tk.END, message)
+        self.routeOutput.configure(state='disabled')
+        self.saveButton.config(state = "disabled")
+    
+    #check whether the route being waited for has been found, showing it if it has and the search's progress if it hasn't
+    def pollRoute(self):
+        if self.routeQuery is None:
+            return
+        finished = self.routeWorker.poll()
+        if finished is not None and finished[0] == self.routeQuery:
+            self.routeQuery = None
+            version, result = finished[1], finished[2]
+            #a search that finished before the closures changed, or while they were changing, can't be cancelled any more, but its
+            #route may run through a station or line that has just been closed
+            if isinstance(result, RouteCancelled) or version != self.network.closureVersion:
+                self.showProgress("Route cancelled, the closures changed. Find the route again")
+            elif isinstance(result, Exception):
+                self.showProgress("Route could not be found: " + str(result))
+            else:
+                self.displayRoute(result)
+            return
+        self.showProgress("Finding route... " + str(self.routeWorker.progress()) + " stations searched")
+        self.window.after(self.pollInterval, self.pollRoute)
+    
+    #write a route found by findRoute to the route output
+    def displayRoute(self, path):
+        self.routeOutput.configure(state='normal')
+        self.routeOutput.delete(1.0,tk.END)
+        routeSave = []
         if (path is None):
             self.routeOutput.insert(tk.END, ("Route not reachable. Check closures"))
             self.saveButton.config(state = "disabled")
         else:
             for item in path[0]:
                 try:
-                    self.routeOutput.insert(tk.END, (theNetwork.stations[item].getName()) + "\n")
-                    routeSave.append(theNetwork.stations[item].getName() + "\n")
+                    self.routeOutput.insert(tk.END, (self.network.stations[item].getName()) + "\n")
+                    routeSave.append(self.network.stations[item].getName() + "\n")
                     self.saveButton.config(state = "normal")
                 except KeyError:
                     self.routeOutput.insert(tk.END, (item + "\n"))
@@ -398,30 +441,30 @@ class GUI:
     def lineToggle(self):
         self.log.configure(state='normal')
         chosen = self.option.get()
-        lNumber = theNetwork.lines[chosen]
-        if(lNumber in theNetwork.closedLines):
-            theNetwork.closedLines.remove(lNumber)
-            self.log.insert(tk.END, (chosen + " has been opened \n"))
-        else:
-            theNetwork.closedLines.append(lNumber)
+        lNumber = self.network.lines[chosen]
+        self.routeWorker.cancel()
+        if(self.network.toggleLine(lNumber)):
             self.log.insert(tk.END, (chosen + " has been closed \n"))
+            self.canvas.itemconfig("line" + lNumber, dash = (5, 2))
+        else:
+            self.log.insert(tk.END, (chosen + " has been opened \n"))
+            self.canvas.itemconfig("line" + lNumber, dash = "")
         self.log.configure(state='disabled')
-        self.draw()
     
     #change the closuresFrame colour to the colour of the line selected
     def colourShow(self, chosen):
-        finder = linesCSV.getCol("name").index(chosen)
-        colour = ("#" + linesCSV.getCol("colour")[finder])
+        colour = self.network.lineColours.get(self.network.lines[chosen], "#000000")
         self.closuresFrame.configure(background=colour)
     
     #clear the closedStations List
     def openAll(self):
-        theNetwork.closedLines.clear()
-        self.draw()
+        self.routeWorker.cancel()
+        self.network.openAllLines()
+        self.canvas.itemconfig("connection", dash = "")
         self.log.configure(state='normal')
         self.log.insert(tk.END, ( "All lines open \n"))
         self.log.configure(state='disabled')
-        #print(theNetwork.closedLines)
+        #print(self.network.closedLines)
     
     #save the created route as a text file
     def saveRoute(self):
@@ -442,59 +485,204 @@ class GUI:
         self.yOffset = self.stationSize  +2 
         self.draw()
         
-    #update the canvas. draws stations on top of connections
+    #return the fill colour of a station's square
+    def stationColour(self, ID):
+        if (self.network.stations[ID].isActive()):
+            return 'green'
+        return 'red'
+    
+    #return the canvas coordinates of a station's square and the position of its name, from the canvas position of its centre
+    def stationBox(self, x, y):
+        size = self.stationSize*self.zoom
+        return (x - size, y + size, x + size, y - size), (x, y - 1.6*size)
+    
+    #return the font for station names at the current zoom
+    def nameFont(self):
+        nameSize = int(2.2*(self.zoom - 7))
+        if (nameSize > 21):
+            nameSize = 20
+        return ('Comic', max(nameSize, 1), 'bold')
+    
+    #return the zoom level text
+    def zoomText(self):
+        if (self.zoom > 5):
+            return ("Zoom level: " + str(int(self.zoom)))
+        return ("Zoom level: " + str(round(self.zoom, 1)))
+        
+    #work out the map positions and index the stations and the bounding boxes of the connections. only redone if the map's bounds have changed
+    def buildIndex(self):
+        if self.renderData is not None and self.renderData.bounds == RenderData.boundsOf(self.network.getGraph()) and self.renderData.ids is self.network.getGraph().ids:
+            return
+        data = RenderData(self.network, self.cwidth, self.cheight)
+        self.renderData = data
+        self.stationGrid = SpatialGrid(self.gridCellSize)
+        self.connectionGrid = SpatialGrid(self.gridCellSize)
+        for i in range(len(data.ids)):
+            self.stationGrid.insert(i, data.nlong[i], data.nlat[i], data.nlong[i], data.nlat[i])
+        #a polyline is put in the cells of each of its segments, so it is drawn as soon as any part of it comes into view
+        for k, (line, points) in enumerate(data.polylines):
+            for start, end in zip(points, points[1:]):
+                self.connectionGrid.insert(k, data.nlong[start], data.nlat[start], data.nlong[end], data.nlat[end])
+    
+    #return the part of the map on the canvas as a rectangle in normalised coordinates, with a margin for station squares
+    def viewport(self):
+        margin = self.stationSize + 1
+        x1 = 0/self.zoom - self.xOffset - margin
+        x2 = (self.cwidth + self.stationSize)/self.zoom - self.xOffset + margin
+        y1 = self.cheight + self.yOffset - (self.cheight + self.stationSize)/self.zoom - margin
+        y2 = self.cheight + self.yOffset + margin
+        return (x1, y1, x2, y2)
+        
+    #start a new canvas. only the zoom level is drawn here, the map items are created by showViewport as they come into view
     def draw(self):
         self.canvas.delete("all")
-        #draw the connections
-        for item in theNetwork.stations:
-            for connec in theNetwork.stations[item].getConnections():
-                destID = connec[0]
-                finder = linesCSV.getCol("line").index(connec[2])
-                colour = ("#" + linesCSV.getCol("colour")[finder])
-                crds1 = self.normalise(theNetwork.stations[item].getCoords())
-                crds2 = self.normalise(theNetwork.stations[destID].getCoords())
-                cx1 = ((crds1[1]) + self.xOffset)*self.zoom
-                cy1 = ((self.cheight - (crds1[0])) + self.yOffset)*self.zoom
-                cx2 = ((crds2[1]) + self.xOffset)*self.zoom
-                cy2 = ((self.cheight - (crds2[0])) + self.yOffset)*self.zoom
-                if (connec[2] in theNetwork.closedLines):
-                    self.canvas.create_line(cx1, cy1, cx2, cy2, fill = colour, width = self.lineWidth, dash = (5, 2)) + self.yOffset
-                else:  
-                    self.canvas.create_line(cx1, cy1, cx2, cy2, fill = colour, width = self.lineWidth) + self.yOffset
-            
-            #draw the stations        
-        for item in theNetwork.stations: 
-            crds = self.normalise(theNetwork.stations[item].getCoords())   
-            x1 = (((crds[1])-self.stationSize) + self.xOffset)*self.zoom
-            y1 = ((self.cheight - ((crds[0])-self.stationSize)) + self.yOffset)*self.zoom
-            x2 = (((crds[1])+self.stationSize) + self.xOffset)*self.zoom
-            y2 = ((self.cheight - ((crds[0])+self.stationSize)) + self.yOffset)*self.zoom
-            if (theNetwork.stations[item].isActive()):
-                sColour = 'green'
-            if not (theNetwork.stations[item].isActive()):
-                sColour = 'red' 
-            self.canvas.create_rectangle(x1, y1, x2, y2, fill = sColour)
+        self.buildIndex()
+        self.drawnCells = set()
+        self.drawnStations = set()
+        self.drawnLabels = set()
+        self.drawnConnections = set()
+        #the highest tier of stations and of names created in each grid cell, so zooming in only creates the tiers that are new to a cell
+        self.cellStationTiers = {}
+        self.cellLabelTiers = {}
         
-        #draw station names
+        #draw the zoom level
+        self.zoomindex = self.zoomText()
+        self.canvas.create_text(50,490,fill="black",font=('Comic', '10', 'bold'), text=self.zoomindex, tags = "zoomLevel")
+        
+        #the view the items on the canvas were drawn for
+        self.drawnZoom = self.zoom
+        self.drawnXOffset = self.xOffset
+        self.drawnYOffset = self.yOffset
+        self.drawnStationSize = self.stationSize
+        self.drawnStationTier = self.stationTier()
+        self.drawnLabelTier = self.labelTier()
+        self.showViewport()
+    
+    #return the highest tier of stations to show, which is every tier on small maps
+    def stationTier(self):
+        if (len(self.renderData.ids) <= self.fullDetail):
+            return self.renderData.tierCount
+        return self.renderData.maxTier(self.zoom, self.stationSpacing)
+    
+    #return the highest tier of station names to show, or -1 if names are hidden at this zoom
+    def labelTier(self):
         if (self.zoom > 10):
-            for item in theNetwork.stations: 
-                name = theNetwork.stations[item].getName()
-                ncrds = self.normalise( theNetwork.stations[item].getCoords())
-                nx = ((ncrds[1]) + self.xOffset)*self.zoom
-                ny = (((self.cheight - (ncrds[0])) + self.yOffset)*self.zoom) - ((self.stationSize*1.6)*self.zoom)
-                
-                nameSize = str(int(2.2*(self.zoom - 7)))
-                if (int(nameSize) > 21):
-                    nameSize = 20
-                #print(nameSize)
-                self.canvas.create_text(nx,ny,fill="black",font=('Comic', nameSize, 'bold'), text=name)
+            return self.renderData.maxTier(self.zoom, self.labelSpacing)
+        return -1
+    
+    #create the items in grid cells that have come into view and haven't been drawn yet. items that have been drawn are kept, and moved with the rest.
+    #stations and names are only created for the level of detail tiers shown at this zoom, and the higher tiers of a cell when zooming in
+    #first reaches them. every item is tagged "map" so updateView can move and scale them all at once, polylines by "connection" and their line,
+    #and stations and names by their station ID and level of detail tier, so closures and zooming only reconfigure them
+    def showViewport(self):
+        view = list(self.connectionGrid.cellsIn(*self.viewport()))
+        stationTier = self.stationTier()
+        labelTier = self.labelTier()
+        cells = [cell for cell in view if cell not in self.drawnCells]
+        stationCells = [cell for cell in view if self.cellStationTiers.get(cell, -1) < stationTier]
+        labelCells = [cell for cell in view if self.cellLabelTiers.get(cell, -1) < labelTier]
+        if not (cells or stationCells or labelCells):
+            return
+        self.drawnCells.update(cells)
+        data = self.renderData
+        closedLines = set(self.network.closedLines)
         
-        #draw the zoom level
-        if (self.zoom > 5):
-            self.zoomindex = ("Zoom level: " + str(int(self.zoom)))
-        else:
-            self.zoomindex = ("Zoom level: " + str(round(self.zoom, 1)))
-        self.canvas.create_text(50,490,fill="black",font=('Comic', '10', 'bold'), text=self.zoomindex)  
+        #find what hasn't been drawn yet, then work out the canvas positions of just those stations
+        polylines = []
+        for cell in cells:
+            for k in self.connectionGrid.cells.get(cell, ()):
+                if k not in self.drawnConnections:
+                    self.drawnConnections.add(k)
+                    polylines.append(k)
+        stations = self.newTiers(stationCells, self.cellStationTiers, stationTier)
+        labels = self.newTiers(labelCells, self.cellLabelTiers, labelTier)
+        self.drawnStations.update(stations)
+        self.drawnLabels.update(labels)
+        needed = set(stations)
+        needed.update(labels)
+        for k in polylines:
+            needed.update(data.polylines[k][1])
+        positions = data.positions(needed, self.xOffset, self.yOffset, self.zoom)
+        
+        #draw the lines
+        for k in polylines:
+            line, points = data.polylines[k]
+            coords = []
+            for i in points:
+                coords.extend(positions[i])
+            tags = ("map", "connection", "line" + line)
+            if (line in closedLines):
+                self.canvas.create_line(*coords, fill = data.colours[line], width = self.lineWidth, dash = (5, 2), tags = tags)
+            else:  
+                self.canvas.create_line(*coords, fill = data.colours[line], width = self.lineWidth, tags = tags)
+            
+        #draw the stations and their names
+        font = self.nameFont()
+        for i in stations:
+            item = data.ids[i]
+            box = self.stationBox(*positions[i])[0]
+            self.canvas.create_rectangle(*box, fill = self.stationColour(item), tags = ("map", "station", "station" + item, "tier" + str(data.tiers[i])))
+        for i in labels:
+            item = data.ids[i]
+            namePos = self.stationBox(*positions[i])[1]
+            self.canvas.create_text(*namePos, fill="black", font=font, text=self.network.stations[item].getName(), tags = ("map", "label", "label" + item, "labeltier" + str(data.tiers[i])))
+        
+        #connections drawn now would otherwise sit on top of stations drawn earlier
+        self.canvas.tag_raise("station")
+        self.canvas.tag_raise("label")
+    
+    #return the stations in some grid cells with tiers above the highest already created in their cell, up to tier, and record
+    #that the cells now have every tier up to it. tiers is the dict of the highest tier created in each cell
+    def newTiers(self, cells, tiers, tier):
+        stations = []
+        for cell in cells:
+            drawn = tiers.get(cell, -1)
+            tiers[cell] = tier
+            for i in self.stationGrid.cells.get(cell, ()):
+                if drawn < self.renderData.tiers[i] <= tier:
+                    stations.append(i)
+        return stations
+    
+    #bring the existing canvas items to the current zoom and offset instead of drawing them again, then draw anything that has come into view.
+    #every map coordinate is (position + offset)*zoom, so a zoom change is a scale about the canvas origin and an offset change is a move
+    def updateView(self):
+        if (self.zoom != self.drawnZoom):
+            factor = self.zoom/self.drawnZoom
+            self.canvas.scale("map", 0, 0, factor, factor)
+        if (self.xOffset != self.drawnXOffset or self.yOffset != self.drawnYOffset):
+            self.canvas.move("map", (self.xOffset - self.drawnXOffset)*self.zoom, (self.yOffset - self.drawnYOffset)*self.zoom)
+        
+        #station squares only need redrawing when they change size
+        if (self.stationSize != self.drawnStationSize):
+            positions = self.renderData.positions(self.drawnStations | self.drawnLabels, self.xOffset, self.yOffset, self.zoom)
+            for i in self.drawnStations:
+                self.canvas.coords("station" + self.renderData.ids[i], *self.stationBox(*positions[i])[0])
+            for i in self.drawnLabels:
+                self.canvas.coords("label" + self.renderData.ids[i], *self.stationBox(*positions[i])[1])
+        
+        if (self.zoom != self.drawnZoom):
+            if (self.zoom > 10):
+                self.canvas.itemconfig("label", font = self.nameFont())
+            self.zoomindex = self.zoomText()
+            self.canvas.itemconfig("zoomLevel", text = self.zoomindex)
+            
+            #show or hide whole tiers of stations and names when the level of detail changes
+            stationTier = self.stationTier()
+            if (stationTier != self.drawnStationTier):
+                for tier in range(self.renderData.tierCount + 1):
+                    self.canvas.itemconfig("tier" + str(tier), state = 'normal' if tier <= stationTier else 'hidden')
+                self.drawnStationTier = stationTier
+            labelTier = self.labelTier()
+            if (labelTier != self.drawnLabelTier):
+                for tier in range(self.renderData.tierCount + 1):
+                    self.canvas.itemconfig("labeltier" + str(tier), state = 'normal' if tier <= labelTier else 'hidden')
+                self.drawnLabelTier = labelTier
+        
+        self.drawnZoom = self.zoom
+        self.drawnXOffset = self.xOffset
+        self.drawnYOffset = self.yOffset
+        self.drawnStationSize = self.stationSize
+        self.showViewport()
 #///////////////////////////END OF GUI//////////////////////////////////////////// 
 
 
@@ -503,49 +691,11 @@ class GUI:
 
 #checks to see whether this program is being used as a module and if not, run the London Underground code.
 if __name__ == "__main__":    
-    #construct CSV objects
-    stationsCSV = CSV("london.stations.CSV")    
-    connectionsCSV = CSV("london.connections.csv")
-    linesCSV = CSV("london.lines.csv")
-    #give connectionsCSV an additional column for unique IDs to be used for iteration
-    newids = list(range(1, len(connectionsCSV.getCol("station1"))))
-    connectionsCSV.addCol("ID", newids)
-
     #Construct Network
-    theNetwork = Network()
-
-    #generate stations from the stations CSV file and add them to the network
-    for item in stationsCSV.getCol("id"):
-        finder = stationsCSV.getCol("id").index(item)
-        lat = float(stationsCSV.getCol("latitude")[finder])
-        long = float(stationsCSV.getCol("longitude")[finder])
-        nom = stationsCSV.getCol("name")[finder]
-        theNetwork.addStation(item, (lat,long),nom)
-
-
-    #populate each station's list of connections from the connections CSV file
-    for id1 in theNetwork.stations:
-    
-        for item in connectionsCSV.getCol("ID"):
-            finder = connectionsCSV.getCol("ID").index(item)
-            s1 = connectionsCSV.getCol("station1")[finder]
-            s2 = connectionsCSV.getCol("station2")[finder]
-            line = connectionsCSV.getCol("line")[finder]
-            time = connectionsCSV.getCol("time")[finder]
-        
-            #add connections where the station is station 1, and where it's station 2
-            if (s1 == id1):
-                theNetwork.stations[id1].addConnection(s2, time, line)
-            
-            if(s2 == id1):
-                theNetwork.stations[id1].addConnection(s1, time, line)
-
-    for item in linesCSV.getCol("name"):
-        finder = linesCSV.getCol("name").index(item)
-        theNetwork.lines[item] = linesCSV.getCol("line")[finder]
+    network = loadNetwork("london")
     
     #create the GUI object
-    gui = GUI()
+    gui = GUI(network)
 
     #start the GUI
     gui.draw()
@@ -0,0 +1,2736 @@
+# -*- coding: utf-8 -*-
+"""The route finding engine: networks of stations loaded from CSV files, the searches over them, and the data the map is drawn from.
+Nothing here uses tkinter and importing it has no side effects, so batch jobs and services can use it without the GUI.
+Run it to find routes from the command line:
+    python subway.py "Baker Street" "Bank"
+    python subway.py --batch queries.csv"""
+#import libraries
+from collections import defaultdict, OrderedDict
+import csv
+import heapq # priority queue for route finding
+import math
+from array import array # compact storage for the network's connections
+import bisect
+import ast
+import json
+import mmap # lets the travel time matrices be read from disk without loading them into memory
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+
+#numpy is optional, and slow to import, so it is only imported when RenderData.toCanvas is first called. used to work out the canvas
+#position of every station in one step
+def importNumpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+#///////////////////////////////////CLASSES//////////////////////////////////////////////
+
+
+class CSV:
+    """takes a CSV file and stores its data in a dictionary of lists"""
+    #read a csv file into a dictionary
+    def __init__(self, fileName):
+        self.CSVDict = defaultdict(list)
+        for record in csv.DictReader(open(fileName)):
+              for key, val in record.items():   
+                   self.CSVDict[key].append(val)
+                   
+   #to be used to add unique IDs to CSV files that have none                
+    def addCol(self, key, column):
+       self.CSVDict[key] = column
+       
+    #return a column from the csv file as a list    
+    def getCol(self, colName):
+        return self.CSVDict[colName]
+       
+
+
+
+class Station:
+    """Represents one node on the network"""
+    __slots__ = ("coords", "name", "active", "_connections", "_graph", "_index", "_network")
+    
+    def __init__(self, coords, name):
+        self.coords = coords
+        self.name = name
+        self._connections = []
+        self.active = True
+        #set when the station's connections are held by a CompactGraph instead of its own list
+        self._graph = None
+        self._index = None
+        #the network that is told when the station is opened or closed
+        self._network = None
+    
+    #the station's list of connections. once the network is compacted this is read from the graph's arrays
+    @property
+    def connections(self):
+        if self._graph is not None:
+            return self._graph.connectionsOf(self._index)
+        return self._connections
+    
+    #bind the station to a compact graph, dropping its own list of connections
+    def bind(self, graph, index):
+        self._graph = graph
+        self._index = index
+        self._connections = None
+    
+    #take the connections back out of the compact graph so they can be edited. the graph is marked stale so the network rebuilds it
+    def unbind(self):
+        if self._graph is not None:
+            self._connections = self._graph.connectionsOf(self._index)
+            self._graph.stale = True
+            self._graph = None
+            self._index = None
+        
+    #add a connection to a neighbour    
+    def addConnection(self,ID, distance, line):
+        self.unbind()
+        self._connections.append((ID, distance, line))
+    
+    #remove a specified neighbor
+    def removeConnection(self,connection):
+        self.unbind()
+        self._connections.remove(connection)
+    
+    #return the station's coordinates
+    def getCoords(self):
+        return self.coords
+    
+    #return the station's name
+    def getName(self):
+        return self.name
+    
+    #return the station's list of connections
+    def getConnections(self):
+        return self.connections
+    
+    #return the active state of the station
+    def isActive(self):
+        return self.active
+    
+    #toggle the station
+    def toggleActive(self):
+            self.active = not self.active
+            if self._graph is not None:
+                self._graph.active[self._index] = self.active
+            if self._network is not None:
+                self._network.stationToggled(self)
+
+
+
+
+#write arrays to a file as a magic number, a JSON header and one section per array, so they can be memory-mapped by readSections.
+#sections is a list of (name, array) pairs. arrays or memoryviews of any fixed size type can be written, including ones mapped from
+#the file being replaced: it's written to a temporary file beside it first, then moved over it
+def writeSections(path, magic, header, sections):
+    layout = []
+    position = 0
+    for name, values in sections:
+        typecode = values.typecode if isinstance(values, array) else values.format
+        layout.append({"name": name, "typecode": typecode, "offset": position, "length": len(values)})
+        #each section starts on an 8 byte boundary so it can be cast straight from the mapped file
+        position += -(-len(values)*values.itemsize//8)*8
+    header = json.dumps(dict(header, sections = layout)).encode("utf-8")
+    header += b" "*(-(len(magic) + 4 + len(header)) % 8)
+    handle, temporary = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)), prefix = os.path.basename(path) + ".")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(magic + len(header).to_bytes(4, "little") + header)
+            for name, values in sections:
+                data = values.tobytes()
+                f.write(data + b"\0"*(-len(data) % 8))
+        #mkstemp makes the file readable only by its owner. give it the permissions of the file it replaces, or the ones open would have
+        if os.path.exists(path):
+            os.chmod(temporary, os.stat(path).st_mode & 0o777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temporary, 0o666 & ~umask)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+#memory-map a file written by writeSections. returns the header and {name: memoryview} for the sections, which read straight from the mapping.
+#the last byte of the magic number is the format's version
+def readSections(path, magic, description):
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    if mapped[:len(magic) - 1] != magic[:-1]:
+        raise ValueError(path + " is not a " + description)
+    if mapped[len(magic) - 1] != magic[-1]:
+        raise ValueError(path + " is a version " + str(mapped[len(magic) - 1]) + " " + description + ", expected version " + str(magic[-1]))
+    headerLength = int.from_bytes(mapped[len(magic):len(magic) + 4], "little")
+    start = len(magic) + 4
+    header = json.loads(mapped[start:start + headerLength].decode("utf-8"))
+    start += headerLength
+    view = memoryview(mapped)
+    sections = {}
+    for section in header["sections"]:
+        size = array(section["typecode"]).itemsize
+        offset = start + section["offset"]
+        sections[section["name"]] = view[offset:offset + section["length"]*size].cast(section["typecode"])
+    return header, sections
+
+
+
+
+class CompactGraph:
+    """The connections of a network stored as arrays. Stations are numbered 0 to n-1 and each station's connections are the
+    slice offsets[i]:offsets[i+1] of targets, times and lines (compressed sparse row layout). Lines are stored as small integer codes"""
+    __slots__ = ("ids", "index", "offsets", "targets", "times", "lines", "lineIds", "lineCodes", "active", "lats", "longs", "stale", "speed", "reverseArrays", "lastSearch")
+    graphMagic = b"TRGRAPH\x02"
+    #mean radius of the earth in km, for great-circle distances
+    earthRadius = 6371.0
+    
+    def __init__(self, ids, offsets, targets, times, lines, lineIds, active, lats, longs):
+        self.ids = ids
+        self.index = dict(zip(ids, range(len(ids))))
+        self.offsets = offsets
+        self.targets = targets
+        self.times = times
+        self.lines = lines
+        self.lineIds = lineIds
+        self.lineCodes = {line: code for code, line in enumerate(lineIds)}
+        self.active = active
+        self.lats = lats
+        self.longs = longs
+        self.stale = False
+        #worked out the first time they are needed
+        self.speed = None
+        self.reverseArrays = None
+        #the closed line mask and settled stations of the last search, for lastConnections
+        self.lastSearch = None
+    
+    #build the arrays from a dictionary of Stations
+    @classmethod
+    def fromStations(cls, stations):
+        ids = list(stations)
+        index = {ID: i for i, ID in enumerate(ids)}
+        offsets = array("q", [0])
+        targets = array("i")
+        times = array("i")
+        lines = array("H")
+        lineIds = []
+        lineCodes = {}
+        active = bytearray(len(ids))
+        lats = array("d")
+        longs = array("d")
+        for i, ID in enumerate(ids):
+            station = stations[ID]
+            active[i] = station.isActive()
+            lats.append(station.getCoords()[0])
+            longs.append(station.getCoords()[1])
+            for connection in station.getConnections():
+                if connection[2] not in lineCodes:
+                    lineCodes[connection[2]] = len(lineIds)
+                    lineIds.append(connection[2])
+                targets.append(index[connection[0]])
+                times.append(int(connection[1]))
+                lines.append(lineCodes[connection[2]])
+            offsets.append(len(targets))
+        return cls(ids, offsets, targets, times, lines, lineIds, active, lats, longs)
+    
+    #return the graph's arrays as (name, array) sections for writeSections
+    def sections(self):
+        return [("offsets", self.offsets), ("targets", self.targets), ("times", self.times), ("lines", self.lines), ("active", array("B", self.active)), ("lats", self.lats), ("longs", self.longs)]
+    
+    #build a graph from the sections written by sections(). the arrays are used as they are, except the active flags which are copied so stations can still be toggled
+    @classmethod
+    def fromSections(cls, ids, lineIds, sections):
+        return cls(ids, sections["offsets"], sections["targets"], sections["times"], sections["lines"], lineIds, bytearray(sections["active"]), sections["lats"], sections["longs"])
+    
+    #write the graph's arrays to a file that other processes can memory-map with CompactGraph.load
+    def save(self, path):
+        writeSections(path, self.graphMagic, {"ids": self.ids, "lineIds": self.lineIds}, self.sections())
+    
+    #memory-map a file written by save
+    @classmethod
+    def load(cls, path):
+        header, sections = readSections(path, cls.graphMagic, "saved CompactGraph")
+        return cls.fromSections(header["ids"], header["lineIds"], sections)
+    
+    #return the number of stations in the graph
+    def size(self):
+        return len(self.ids)
+    
+    #return the connections of station i as (ID, time, line) tuples, the same shape as Station.connections
+    def connectionsOf(self, i):
+        ids = self.ids
+        targets = self.targets
+        times = self.times
+        lines = self.lines
+        lineIds = self.lineIds
+        return [(ids[targets[k]], times[k], lineIds[lines[k]]) for k in range(self.offsets[i], self.offsets[i + 1])]
+    
+    #return a mask indexed by line code that is set for every closed line
+    def closedMask(self, closedLines):
+        mask = bytearray(len(self.lineIds))
+        for line in closedLines:
+            code = self.lineCodes.get(line)
+            if code is not None:
+                mask[code] = 1
+        return mask
+    
+    #Dijkstra's algorithm over the arrays. yields each station index with its distance as it is settled, filling in predecessor as it goes.
+    #connections on closed lines and into closed stations are skipped
+    def search(self, source, closed, predecessor):
+        offsets = self.offsets
+        targets = self.targets
+        times = self.times
+        lines = self.lines
+        active = self.active
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        infinity = 9999999999
+        distance = {source: 0}
+        settled = set()
+        self.lastSearch = (closed, settled, ())
+        queue = [(0, source)]
+        while queue:
+            d, node = heappop(queue)
+            if node in settled:
+                continue
+            settled.add(node)
+            yield node, d
+            for k in range(offsets[node], offsets[node + 1]):
+                if closed[lines[k]]:
+                    continue
+                neighbour = targets[k]
+                if neighbour in settled or not active[neighbour]:
+                    continue
+                newDistance = d + times[k]
+                if newDistance < distance.get(neighbour, infinity):
+                    distance[neighbour] = newDistance
+                    predecessor[neighbour] = node
+                    heappush(queue, (newDistance, neighbour))
+    
+    #return the great-circle distance in km between stations i and j
+    def distanceBetween(self, i, j):
+        lat1 = math.radians(self.lats[i])
+        lat2 = math.radians(self.lats[j])
+        a = math.sin((lat2 - lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(math.radians(self.longs[j] - self.longs[i])/2)**2
+        return 2*self.earthRadius*math.asin(min(1.0, math.sqrt(a)))
+    
+    #return the fastest speed, in km per minute, of any connection in the graph. dividing a straight line distance by this can never
+    #overestimate a travel time, which is what makes it safe to use as the A* heuristic. if a connection takes no time the speed is infinite
+    def heuristicSpeed(self):
+        if self.speed is None:
+            speed = 0.0
+            for i in range(len(self.ids)):
+                for k in range(self.offsets[i], self.offsets[i + 1]):
+                    length = self.distanceBetween(i, self.targets[k])
+                    if self.times[k] > 0:
+                        speed = max(speed, length/self.times[k])
+                    elif length > 0:
+                        speed = math.inf
+            self.speed = speed
+        return self.speed
+    
+    #A* search from source to target, using the straight line distance to the target divided by the fastest connection speed as the heuristic.
+    #fills in predecessor and returns (distance, number of stations settled). distance is None if the target can't be reached
+    def astar(self, source, target, closed, predecessor):
+        offsets = self.offsets
+        targets = self.targets
+        times = self.times
+        lines = self.lines
+        active = self.active
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        speed = self.heuristicSpeed()
+        infinity = 9999999999
+        
+        #the heuristic is worked out once per station reached
+        estimates = {}
+        def estimate(node):
+            if node not in estimates:
+                if speed == math.inf or speed == 0:
+                    estimates[node] = 0
+                else:
+                    estimates[node] = self.distanceBetween(node, target)/speed
+            return estimates[node]
+        
+        distance = {source: 0}
+        settled = set()
+        self.lastSearch = (closed, settled, ())
+        queue = [(estimate(source), 0, source)]
+        while queue:
+            f, d, node = heappop(queue)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node == target:
+                return (d, len(settled))
+            for k in range(offsets[node], offsets[node + 1]):
+                if closed[lines[k]]:
+                    continue
+                neighbour = targets[k]
+                if neighbour in settled or not active[neighbour]:
+                    continue
+                newDistance = d + times[k]
+                if newDistance < distance.get(neighbour, infinity):
+                    distance[neighbour] = newDistance
+                    predecessor[neighbour] = node
+                    heappush(queue, (newDistance + estimate(neighbour), newDistance, neighbour))
+        return (None, len(settled))
+    
+    #return the graph with every connection reversed, as (offsets, sources, times, lines, edges) arrays, where edges holds the index of
+    #the original connection. used by the backward half of bidirectional search and for repairing shortest path trees
+    def reverse(self):
+        if self.reverseArrays is None:
+            n = len(self.ids)
+            counts = array("q", [0])*(n + 1)
+            for k in range(len(self.targets)):
+                counts[self.targets[k] + 1] += 1
+            for i in range(n):
+                counts[i + 1] += counts[i]
+            offsets = array("q", counts)
+            position = array("q", counts[:n])
+            sources = array("i", [0])*len(self.targets)
+            times = array("i", [0])*len(self.targets)
+            lines = array("H", [0])*len(self.targets)
+            edges = array("q", [0])*len(self.targets)
+            for i in range(n):
+                for k in range(self.offsets[i], self.offsets[i + 1]):
+                    j = self.targets[k]
+                    sources[position[j]] = i
+                    times[position[j]] = self.times[k]
+                    lines[position[j]] = self.lines[k]
+                    edges[position[j]] = k
+                    position[j] += 1
+            self.reverseArrays = (offsets, sources, times, lines, edges)
+        return self.reverseArrays
+    
+    #Dijkstra's algorithm run forwards from the source and backwards from the target at the same time, always advancing the side with
+    #the smaller queue head, until the two searches can't improve on the best meeting point found.
+    #returns (route as graph indices, distance, number of stations settled). the route is None if the target can't be reached
+    def bidirectional(self, source, target, closed):
+        if source == target:
+            self.lastSearch = None
+            return ([source], 0, 1)
+        active = self.active
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        infinity = 9999999999
+        graphs = ((self.offsets, self.targets, self.times, self.lines), self.reverse()[:4])
+        distance = ({source: 0}, {target: 0})
+        predecessor = ({}, {})
+        settled = (set(), set())
+        self.lastSearch = (closed, settled[0], settled[1])
+        queues = ([(0, source)], [(0, target)])
+        best = infinity
+        meeting = None
+        
+        while queues[0] and queues[1]:
+            if queues[0][0][0] + queues[1][0][0] >= best:
+                break
+            side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+            d, node = heappop(queues[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+            offsets, targets, times, lines = graphs[side]
+            ownDistance = distance[side]
+            otherDistance = distance[1 - side]
+            for k in range(offsets[node], offsets[node + 1]):
+                if closed[lines[k]]:
+                    continue
+                neighbour = targets[k]
+                if neighbour in settled[side] or not active[neighbour]:
+                    continue
+                newDistance = d + times[k]
+                if newDistance < ownDistance.get(neighbour, infinity):
+                    ownDistance[neighbour] = newDistance
+                    predecessor[side][neighbour] = node
+                    heappush(queues[side], (newDistance, neighbour))
+                if neighbour in otherDistance and newDistance + otherDistance[neighbour] < best:
+                    best = newDistance + otherDistance[neighbour]
+                    meeting = (node, neighbour) if side == 0 else (neighbour, node)
+        
+        count = len(settled[0]) + len(settled[1])
+        if meeting is None:
+            return (None, None, count)
+        #the meeting connection joins the end of the forward route to the start of the backward one
+        route = []
+        currentNode = meeting[0]
+        while (currentNode != source):
+            route.append(currentNode)
+            currentNode = predecessor[0][currentNode]
+        route.append(source)
+        route.reverse()
+        currentNode = meeting[1]
+        while (currentNode != target):
+            route.append(currentNode)
+            currentNode = predecessor[1][currentNode]
+        route.append(target)
+        return (route, best, count)
+    
+    #return (connections relaxed, connections skipped because of a closed line or station) by the last search, counted along the
+    #connections of the stations it settled. they are worked out here rather than as the search goes so that searching isn't slowed
+    #down by counting. the stations settled by the backward half of a bidirectional search are counted along the reversed connections
+    def lastConnections(self):
+        if self.lastSearch is None:
+            return (0, 0)
+        closed, forward, backward = self.lastSearch
+        active = self.active
+        relaxed = 0
+        skipped = 0
+        sides = [(forward, self.offsets, self.targets, self.lines)]
+        if backward:
+            offsets, sources, times, lines, edges = self.reverse()
+            sides.append((backward, offsets, sources, lines))
+        for settled, offsets, targets, lines in sides:
+            for node in settled:
+                for k in range(offsets[node], offsets[node + 1]):
+                    if closed[lines[k]] or not active[targets[k]]:
+                        skipped += 1
+                    else:
+                        relaxed += 1
+        return (relaxed, skipped)
+    
+    #return the list of station IDs from source to target using a predecessor dictionary filled in by search
+    def path(self, predecessor, source, target):
+        route = []
+        currentNode = target
+        while (currentNode != source):
+            route.append(self.ids[currentNode])
+            currentNode = predecessor[currentNode]
+        route.append(self.ids[source])
+        route.reverse()
+        return route
+
+
+
+
+class LRUCache:
+    """A bounded dictionary that evicts the least recently used entry once it is full. Counts hits, misses and evictions"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    #return (True, value) if the key is cached, otherwise (False, None)
+    def lookup(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return (False, None)
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return (True, value)
+    
+    #add an entry, evicting the oldest one if the cache is full
+    def store(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last = False)
+            self.evictions += 1
+    
+    #empty the cache without resetting the counters
+    def clear(self):
+        self.entries.clear()
+    
+    #return the cache's counters
+    def stats(self):
+        return {"size": len(self.entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+
+class QueryStats:
+    """Timings and counters for the route queries a Network answers while its instrumentation is enabled. Each search mode gets a
+    latency histogram with a bucket for every power of two microseconds, the stations its queries settled, the connections they relaxed
+    and skipped because of closures, where their answers came from, and optionally the peak memory they allocated. The slowest queries
+    can also be profiled with cProfile"""
+    #the last bucket holds every query that took longer than about a minute
+    buckets = 28
+    
+    def __init__(self, slowest = 0, memory = False):
+        self.slowest = slowest
+        self.memory = memory
+        self.modes = {}
+        #the slowest profiled queries as a heap of (seconds, sequence number, query, profile), so the fastest of them is dropped first
+        self.slowQueries = []
+        self.count = 0
+        #the dump thread reads the statistics while queries are being recorded
+        self.lock = threading.Lock()
+        self.dumpThread = None
+        self.dumpStop = None
+        #whether tracemalloc was started for these statistics, so close knows to stop it. tracing slows every allocation
+        self.tracing = False
+        if memory:
+            import tracemalloc # imported here so that starting up stays quick
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracing = True
+    
+    #answer a findRoute call for a network, timing it and recording its counters
+    def measure(self, network, ID1, ID2, mode, cancelled):
+        profiler = None
+        if self.slowest:
+            import cProfile
+            profiler = cProfile.Profile()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.reset_peak()
+            memoryBefore = tracemalloc.get_traced_memory()[0]
+        outcome = None
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                return network.lookupRoute(ID1, ID2, mode, cancelled)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        except RouteCancelled:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            outcome = "failed"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if outcome is None:
+                outcome = network.lastOutcome
+            relaxed, skipped = network.lastConnections()
+            peakMemory = None
+            if self.memory:
+                peakMemory = tracemalloc.get_traced_memory()[1] - memoryBefore
+            self.record(mode, seconds, outcome, network.lastSettled, relaxed, skipped, peakMemory)
+            if profiler is not None:
+                query = {"origin": ID1, "destination": ID2, "mode": mode, "seconds": seconds, "outcome": outcome, "settled": network.lastSettled}
+                if peakMemory is not None:
+                    query["peakMemory"] = peakMemory
+                self.keepIfSlow(seconds, query, profiler)
+    
+    #add a query to the statistics for its search mode. peakMemory is the most memory in bytes it had allocated at once, or None if
+    #memory isn't being traced
+    def record(self, mode, seconds, outcome, settled, relaxed, skipped, peakMemory = None):
+        with self.lock:
+            entry = self.modes.get(mode)
+            if entry is None:
+                entry = self.modes[mode] = {"queries": 0, "seconds": 0.0, "max": 0.0, "settled": 0, "relaxed": 0, "skipped": 0,
+                                            "outcomes": {}, "histogram": [0]*self.buckets, "memoryQueries": 0, "peakMemory": 0,
+                                            "maxPeakMemory": 0}
+            if peakMemory is not None:
+                entry["memoryQueries"] += 1
+                entry["peakMemory"] += peakMemory
+                entry["maxPeakMemory"] = max(entry["maxPeakMemory"], peakMemory)
+            entry["queries"] += 1
+            entry["seconds"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["settled"] += settled
+            entry["relaxed"] += relaxed
+            entry["skipped"] += skipped
+            entry["outcomes"][outcome] = entry["outcomes"].get(outcome, 0) + 1
+            entry["histogram"][min(int(seconds*1000000).bit_length(), self.buckets - 1)] += 1
+    
+    #keep a profiled query if it is one of the slowest seen so far
+    def keepIfSlow(self, seconds, query, profiler):
+        with self.lock:
+            self.count += 1
+            if len(self.slowQueries) < self.slowest:
+                heapq.heappush(self.slowQueries, (seconds, self.count, query, profiler))
+            elif seconds > self.slowQueries[0][0]:
+                heapq.heapreplace(self.slowQueries, (seconds, self.count, query, profiler))
+    
+    #return the time in seconds that a fraction of a mode's queries finished within, to the nearest bucket of the histogram
+    @staticmethod
+    def percentile(histogram, queries, fraction):
+        total = 0
+        for bucket, count in enumerate(histogram):
+            total += count
+            if total >= fraction*queries:
+                return (1 << bucket)/1000000
+        return None
+    
+    #return the statistics by search mode: query counts, total, mean and maximum time in seconds, estimated percentiles, the mean
+    #stations settled and connections relaxed and skipped, how many answers came from a search, a cached tree ("tree"), the route cache
+    #("hit") or a closed or missing station ("error"), and the histogram as [upper bound in microseconds, queries] pairs. when memory is
+    #traced, the mean and maximum peak memory in bytes are included. the slowest profiled queries are listed under "slowest"
+    def stats(self):
+        with self.lock:
+            modes = {}
+            for mode, entry in self.modes.items():
+                queries = entry["queries"]
+                histogram = entry["histogram"]
+                modes[mode] = {"queries": queries, "seconds": entry["seconds"], "mean": entry["seconds"]/queries, "max": entry["max"],
+                               "p50": self.percentile(histogram, queries, 0.5), "p90": self.percentile(histogram, queries, 0.9),
+                               "p99": self.percentile(histogram, queries, 0.99), "settled": entry["settled"]/queries,
+                               "relaxed": entry["relaxed"]/queries, "skipped": entry["skipped"]/queries, "outcomes": dict(entry["outcomes"]),
+                               "histogram": [[1 << bucket, count] for bucket, count in enumerate(histogram) if count]}
+                if entry["memoryQueries"]:
+                    modes[mode]["peakMemory"] = entry["peakMemory"]/entry["memoryQueries"]
+                    modes[mode]["maxPeakMemory"] = entry["maxPeakMemory"]
+            slowest = [query for seconds, count, query, profiler in sorted(self.slowQueries, reverse = True)]
+        return {"modes": modes, "slowest": slowest}
+    
+    #return the slowest profiled queries, slowest first, each with its profile as text sorted by cumulative time and cut to lines functions
+    def slowestQueries(self, lines = 25):
+        import io
+        import pstats
+        with self.lock:
+            kept = sorted(self.slowQueries, reverse = True)
+        results = []
+        for seconds, count, query, profiler in kept:
+            text = io.StringIO()
+            pstats.Stats(profiler, stream = text).sort_stats("cumulative").print_stats(lines)
+            results.append(dict(query, profile = text.getvalue()))
+        return results
+    
+    #forget every query recorded so far
+    def reset(self):
+        with self.lock:
+            self.modes = {}
+            self.slowQueries = []
+    
+    #write the statistics as a line of JSON every interval seconds, appending to the file at path, or to standard error if path is None
+    def startDump(self, path = None, interval = 60):
+        self.stopDump()
+        stop = threading.Event()
+        def dump():
+            while not stop.wait(interval):
+                line = json.dumps(dict(self.stats(), time = time.time()))
+                if path is None:
+                    print(line, file = sys.stderr, flush = True)
+                else:
+                    with open(path, "a") as f:
+                        f.write(line + "\n")
+        self.dumpStop = stop
+        self.dumpThread = threading.Thread(target = dump, name = "query stats dump", daemon = True)
+        self.dumpThread.start()
+    
+    #stop the periodic dump, if there is one
+    def stopDump(self):
+        if self.dumpThread is not None:
+            self.dumpStop.set()
+            self.dumpThread.join()
+            self.dumpThread = None
+            self.dumpStop = None
+    
+    #stop the periodic dump, and stop tracing memory if these statistics started it
+    def close(self):
+        self.stopDump()
+        self.memory = False
+        if self.tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self.tracing = False
+
+
+class RouteCancelled(Exception):
+    """raised by Network.findRoute when the search was cancelled before it finished"""
+
+
+"""A network composed of Stations"""
+class Network:
+    #the last byte is the version of the snapshot format
+    snapshotMagic = b"TRSNAPS\x01"
+    
+    def __init__(self, routeCacheSize = 4096, treeCacheSize = 64):
+        self.stations = {}
+        self.stationCount = 0
+        self.closedLines = []
+        self.lines = {}
+        self.lineColours = {}
+        self.graph = None
+        #bumped whenever a station or line is opened or closed. cached results are keyed on it so old ones are never returned
+        self.closureVersion = 0
+        self.routeCache = LRUCache(routeCacheSize)
+        self.treeCache = LRUCache(treeCacheSize)
+        #how many stations the last uncached route search settled, the graph or hierarchy it searched, for lastConnections,
+        #and where findRoute got its last answer from: "search", "tree", "hit" (the route cache) or "error"
+        self.lastSettled = 0
+        self.lastSearch = None
+        self.lastOutcome = None
+        self.hierarchy = None
+        self.dynamicTrees = None
+        #a QueryStats that findRoute reports to, set by enableInstrumentation
+        self.instrumentation = None
+        #the departures for earliestArrival and departureProfile, set by loadTimetable
+        self.timetable = None
+        #the index of station names, built by getStationNames
+        self.stationNames = None
+     
+    def addStation(self, ID, coords, name):
+        self.stations[ID] = Station(coords, name)
+        self.stations[ID]._network = self
+        self.stationCount += 1
+        self.stationNames = None
+        if self.graph is not None:
+            self.graph.stale = True
+    
+    #return the index of station names, building it the first time or if stations have been added since
+    def getStationNames(self):
+        if self.stationNames is None:
+            self.stationNames = StationNames(self.stations)
+        return self.stationNames
+    
+    #return the ID of a station given its ID or its name, forgiving case, punctuation and small typing mistakes in names.
+    #returns None if there is no such station, or if the name could mean more than one
+    def findStation(self, text):
+        if text in self.stations:
+            return text
+        return self.getStationNames().resolve(text)
+    
+    #return up to limit stations whose names match what has been typed so far, best first, as (name, ID) pairs
+    def suggestStations(self, text, limit = 10):
+        return self.getStationNames().suggest(text, limit)
+    
+    #return the contraction hierarchy for the network, building it the first time or if the graph has been rebuilt since.
+    #closures don't need a rebuild, the hierarchy re-customizes the arcs they affect on its next query
+    def getHierarchy(self):
+        graph = self.getGraph()
+        if self.hierarchy is None or self.hierarchy.graph is not graph:
+            self.hierarchy = ContractionHierarchy(graph, self.closedLines)
+        return self.hierarchy
+    
+    #keep repaired shortest path trees for the most queried starting stations, so they survive closures instead of being searched again
+    def enableDynamicTrees(self, capacity = 16, hotThreshold = 3):
+        self.dynamicTrees = DynamicTrees(self.getGraph(), self.closedLines, capacity, hotThreshold)
+    
+    #time every findRoute call and count the work it does, aggregated by search mode. slowest keeps a cProfile of that many of the
+    #slowest queries, and memory records the peak memory each query allocated, traced with tracemalloc. returns the QueryStats.
+    #profiling every query makes them several times slower, so slowest is best left at 0 unless a slow query is being looked into
+    def enableInstrumentation(self, slowest = 0, memory = False):
+        self.disableInstrumentation()
+        self.instrumentation = QueryStats(slowest, memory)
+        return self.instrumentation
+    
+    #stop timing queries, any periodic dump of their statistics, and the memory tracing enableInstrumentation started
+    def disableInstrumentation(self):
+        if self.instrumentation is not None:
+            self.instrumentation.close()
+            self.instrumentation = None
+    
+    #return (connections relaxed, connections skipped because of closures) by the last uncached route search. they are counted
+    #from the stations it settled, so this takes about as long as the search did
+    def lastConnections(self):
+        if self.lastSearch is None:
+            return (0, 0)
+        return self.lastSearch.lastConnections()
+    
+    #return the query statistics by search mode, or None if instrumentation isn't enabled
+    def queryStats(self):
+        if self.instrumentation is None:
+            return None
+        return self.instrumentation.stats()
+    
+    #record that the open/closed state of the network has changed, and repair the dynamic trees straight away
+    def closuresChanged(self):
+        self.closureVersion += 1
+        if self.dynamicTrees is not None and self.dynamicTrees.graph is self.graph:
+            self.dynamicTrees.sync(self.closedLines)
+    
+    #called by a Station when it is opened or closed
+    def stationToggled(self, station):
+        self.closuresChanged()
+    
+    #open a closed line or close an open one. returns True if the line is now closed
+    def toggleLine(self, line):
+        if (line in self.closedLines):
+            self.closedLines.remove(line)
+        else:
+            self.closedLines.append(line)
+        self.closuresChanged()
+        return line in self.closedLines
+    
+    #open every line
+    def openAllLines(self):
+        self.closedLines.clear()
+        self.closuresChanged()
+    
+    #find the routes between every origin and every destination using a pool of worker processes. yields (origin, destination, path)
+    #for each origin in turn, with its destinations in the order they were given. the graph is written to a temporary file once and memory-mapped by each worker, and the origins
+    #are handed out in chunks. workers defaults to the number of CPUs
+    def parallelODMatrix(self, origins, destinations, workers = None, chunkSize = 8):
+        graph = self.getGraph()
+        origins = list(origins)
+        destinations = list(destinations)
+        
+        #closed and missing stations are reported here. the workers only search between stations that are open
+        targets = [graph.index[ID] for ID in destinations if ID in self.stations and self.stations[ID].isActive()]
+        searchable = [ID for ID in origins if ID in self.stations and self.stations[ID].isActive()]
+        chunks = [[graph.index[ID] for ID in searchable[i:i + chunkSize]] for i in range(0, len(searchable), chunkSize)]
+        searchableSet = set(searchable)
+        
+        from concurrent.futures import ProcessPoolExecutor # imported here so that starting up stays quick
+        handle, path = tempfile.mkstemp(suffix = ".graph")
+        os.close(handle)
+        try:
+            graph.save(path)
+            with ProcessPoolExecutor(max_workers = workers, initializer = startODWorker, initargs = (path, bytes(graph.closedMask(self.closedLines)), targets)) as executor:
+                #map hands the chunks back in the order they were submitted, so the output order doesn't depend on which worker finishes first
+                results = (result for chunk in executor.map(solveODChunk, chunks) for result in chunk)
+                for origin in origins:
+                    if origin not in searchableSet:
+                        for ID in destinations:
+                            yield origin, ID, self.routeError(origin, ID)
+                        continue
+                    times, ends, nodes = next(results)
+                    k = 0
+                    for ID in destinations:
+                        error = self.routeError(origin, ID)
+                        if error is not None:
+                            yield origin, ID, error
+                            continue
+                        if times[k] < 0:
+                            yield origin, ID, None
+                        else:
+                            yield origin, ID, ([graph.ids[i] for i in nodes[ends[k - 1] if k else 0:ends[k]]], times[k])
+                        k += 1
+        finally:
+            os.remove(path)
+    
+    #build the all-pairs travel time matrices for the network as it is now and save them in a directory
+    def precomputeMatrix(self, directory):
+        return TravelTimeMatrix.precompute(self, directory)
+    
+    #load the timetable that earliestArrival and departureProfile use, from a csv file of service periods or trips (see Timetable.from_csv)
+    def loadTimetable(self, path):
+        self.timetable = Timetable.from_csv(self, path)
+        return self.timetable
+    
+    #return the timetable's closed line mask and the graph's open station flags, for a timetable query
+    def timetableClosures(self):
+        if self.timetable is None:
+            raise ValueError("no timetable has been loaded, see Network.loadTimetable")
+        return self.timetable.closedMask(self.closedLines), self.getGraph().active
+    
+    #find the earliest arrival at station ID2 leaving station ID1 at departure (seconds after midnight) using the timetable, with
+    #connections on closed lines and into closed stations left out. returns (legs, arrival) where legs are (line, from station,
+    #departure, to station, arrival), one for each train taken, None if ID2 can't be reached that day, or an error like findRoute's
+    def earliestArrival(self, ID1, ID2, departure):
+        error = self.routeError(ID1, ID2)
+        if error is not None:
+            return error
+        closed, active = self.timetableClosures()
+        graph = self.getGraph()
+        journey = self.timetable.earliestArrival(graph.index[ID1], graph.index[ID2], departure, closed, active)
+        if journey is None:
+            return None
+        return (self.timetable.legs(journey[0]), journey[1])
+    
+    #return (departure, arrival) for every journey from station ID1 to ID2 leaving between start and end (seconds after midnight)
+    #that isn't beaten by one leaving no earlier and arriving no later, in order of departure. returns an error like findRoute's if a
+    #station is closed or missing
+    def departureProfile(self, ID1, ID2, start, end):
+        error = self.routeError(ID1, ID2)
+        if error is not None:
+            return error
+        closed, active = self.timetableClosures()
+        graph = self.getGraph()
+        return self.timetable.profile(graph.index[ID1], graph.index[ID2], start, end, closed, active)
+    
+    #return the hit, miss and eviction counters of the route and tree caches
+    def cacheStats(self):
+        return {"routes": self.routeCache.stats(), "trees": self.treeCache.stats()}
+    
+    #return the compact graph of the network, building it if the stations have changed since it was last built.
+    #the stations are bound to the graph, so their connections are read from its arrays from then on
+    def getGraph(self):
+        if self.graph is None or self.graph.stale:
+            self.graph = CompactGraph.fromStations(self.stations)
+            for i, ID in enumerate(self.graph.ids):
+                self.stations[ID].bind(self.graph, i)
+            self.closuresChanged()
+        return self.graph
+    
+    #save the whole network to one binary file that load_snapshot can memory-map: the graph's arrays, station IDs and names
+    #as NUL separated UTF-8, and the lines, their colours and which are closed in the header
+    def save_snapshot(self, path):
+        graph = self.getGraph()
+        ids = "\0".join(graph.ids).encode("utf-8")
+        names = "\0".join(self.stations[ID].getName() for ID in graph.ids).encode("utf-8")
+        header = {"stations": graph.size(), "lineIds": graph.lineIds, "lines": self.lines, "lineColours": self.lineColours, "closedLines": self.closedLines}
+        writeSections(path, self.snapshotMagic, header, graph.sections() + [("ids", array("B", ids)), ("names", array("B", names))])
+    
+    #load a network saved by save_snapshot. the graph's arrays are read straight from the memory-mapped file, so loading takes
+    #about as long as making the Station objects, and processes that load the same snapshot share its memory
+    @classmethod
+    def load_snapshot(cls, path):
+        header, sections = readSections(path, cls.snapshotMagic, "network snapshot")
+        count = header["stations"]
+        ids = sections["ids"].tobytes().decode("utf-8").split("\0") if count else []
+        names = sections["names"].tobytes().decode("utf-8").split("\0") if count else []
+        graph = CompactGraph.fromSections(ids, header["lineIds"], sections)
+        
+        network = cls()
+        network.lines = header["lines"]
+        network.lineColours = header["lineColours"]
+        network.closedLines = header["closedLines"]
+        stations = network.stations
+        for i, (ID, name, lat, long, active) in enumerate(zip(ids, names, graph.lats.tolist(), graph.longs.tolist(), graph.active)):
+            station = Station((lat, long), name)
+            station.active = active == 1
+            station._network = network
+            station.bind(graph, i)
+            stations[ID] = station
+        network.stationCount = count
+        network.graph = graph
+        network.closuresChanged()
+        return network
+    
+    #build a network from the stations, connections and lines csv files, reading each file once
+    @classmethod
+    def from_csv(cls, stations, connections, lines):
+        network = cls()
+        
+        with open(stations, newline = "") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            idCol = header.index("id")
+            latCol = header.index("latitude")
+            longCol = header.index("longitude")
+            nameCol = header.index("name")
+            for row in reader:
+                network.addStation(row[idCol], (float(row[latCol]), float(row[longCol])), row[nameCol])
+        
+        #each connection is added to both of its stations in the same pass
+        with open(connections, newline = "") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            s1Col = header.index("station1")
+            s2Col = header.index("station2")
+            lineCol = header.index("line")
+            timeCol = header.index("time")
+            for row in reader:
+                s1 = row[s1Col]
+                s2 = row[s2Col]
+                time = int(row[timeCol])
+                network.stations[s1].addConnection(s2, time, row[lineCol])
+                network.stations[s2].addConnection(s1, time, row[lineCol])
+        
+        with open(lines, newline = "") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            lineCol = header.index("line")
+            nameCol = header.index("name")
+            colourCol = header.index("colour") if "colour" in header else None
+            for row in reader:
+                network.lines[row[nameCol]] = row[lineCol]
+                if colourCol is not None:
+                    network.lineColours[row[lineCol]] = "#" + row[colourCol]
+        
+        return network
+        
+    #return the shortest path tree from a station as (distance, predecessor) dictionaries keyed by graph index.
+    #trees are cached until the network's closures change
+    def shortestPathTree(self, ID):
+        graph = self.getGraph()
+        key = (ID, self.closureVersion)
+        found, tree = self.treeCache.lookup(key)
+        if not found:
+            distance = {}
+            predecessor = {}
+            for node, d in graph.search(graph.index[ID], graph.closedMask(self.closedLines), predecessor):
+                distance[node] = d
+            tree = (distance, predecessor)
+            self.treeCache.store(key, tree)
+        return tree
+        
+    #return the message findRoute gives if the route can't be searched for because a station is closed or missing, otherwise None
+    def routeError(self, ID1, ID2):
+        try:
+            if not (self.stations[ID1].isActive()):
+                return (["Starting station is closed, please choose \nanother station to begin your journey from"], 0)
+            if not(self.stations[ID2].isActive()):
+                return (["Destination station is closed, \nplease choose another"], 0)
+        except KeyError:
+            return (["Destination or starting station not found."], 0)
+        return None
+        
+    #find the fastest route between two given stations.
+    #the search runs over the compact graph, skipping closed lines and closed stations as it reads them, and stops as soon as the destination is settled.
+    #mode picks the search: "dijkstra", "astar" (guided by station coordinates), "bidirectional" or "hierarchy" (the contraction
+    #hierarchy, built on first use). they all find a fastest route.
+    #results are cached until the network's closures change, and a cached shortest path tree from the starting station is used if there is one.
+    #if instrumentation is enabled the query is timed and its counters recorded
+    def findRoute(self, ID1, ID2, mode = "dijkstra", cancelled = None):
+        if self.instrumentation is not None:
+            return self.instrumentation.measure(self, ID1, ID2, mode, cancelled)
+        return self.lookupRoute(ID1, ID2, mode, cancelled)
+    
+    #findRoute without the instrumentation
+    def lookupRoute(self, ID1, ID2, mode = "dijkstra", cancelled = None):
+        error = self.routeError(ID1, ID2)
+        if error is not None:
+            self.lastOutcome = "error"
+            self.lastSettled = 0
+            self.lastSearch = None
+            return error
+        
+        graph = self.getGraph()
+        key = (ID1, ID2, self.closureVersion)
+        found, path = self.routeCache.lookup(key)
+        if not found:
+            path = self.searchRoute(graph, ID1, ID2, mode, cancelled)
+            self.routeCache.store(key, path)
+        else:
+            self.lastOutcome = "hit"
+            self.lastSettled = 0
+            self.lastSearch = None
+        if path is None:
+            return None
+        return (list(path[0]), path[1])
+    
+    #find a route without the route cache, using a cached tree from the starting station if there is one.
+    #cancelled is an optional function that returns True once the route is no longer wanted, in which case RouteCancelled is raised.
+    #dijkstra searches check it as they go, the other modes only before they start
+    def searchRoute(self, graph, ID1, ID2, mode = "dijkstra", cancelled = None):
+        source = graph.index[ID1]
+        target = graph.index[ID2]
+        closed = graph.closedMask(self.closedLines)
+        self.lastSettled = 0
+        self.lastSearch = None
+        self.lastOutcome = "tree"
+        
+        found, tree = self.treeCache.lookup((ID1, self.closureVersion))
+        if found:
+            distance, predecessor = tree
+            if target not in distance:
+                return None
+            return (graph.path(predecessor, source, target), distance[target])
+        
+        if self.dynamicTrees is not None:
+            if self.dynamicTrees.graph is not graph:
+                self.dynamicTrees = DynamicTrees(graph, self.closedLines, self.dynamicTrees.capacity, self.dynamicTrees.hotThreshold)
+            self.dynamicTrees.sync(self.closedLines)
+            tree = self.dynamicTrees.lookup(source)
+            if tree is not None:
+                route = tree.path(target)
+                if route is None:
+                    return None
+                return ([graph.ids[i] for i in route], tree.distance[target])
+        
+        if cancelled is not None and cancelled():
+            raise RouteCancelled()
+        self.lastOutcome = "search"
+        self.lastSearch = graph
+        
+        if mode == "astar":
+            predecessor = {}
+            distance, self.lastSettled = graph.astar(source, target, closed, predecessor)
+            if distance is None:
+                return None
+            return (graph.path(predecessor, source, target), distance)
+        
+        if mode == "bidirectional":
+            route, distance, self.lastSettled = graph.bidirectional(source, target, closed)
+            if route is None:
+                return None
+            return ([graph.ids[i] for i in route], distance)
+        
+        if mode == "hierarchy":
+            self.lastSearch = self.getHierarchy()
+            route, distance, self.lastSettled = self.lastSearch.query(source, target, self.closedLines)
+            if route is None:
+                return None
+            return ([graph.ids[i] for i in route], distance)
+        
+        if mode != "dijkstra":
+            raise ValueError("unknown search mode " + repr(mode))
+        predecessor = {}
+        for node, distance in graph.search(source, closed, predecessor):
+            self.lastSettled += 1
+            if node == target:
+                return (graph.path(predecessor, source, target), distance)
+            if cancelled is not None and self.lastSettled % 256 == 0 and cancelled():
+                raise RouteCancelled()
+        return None
+    
+    #run every search mode between two stations without using the caches, and return {mode: (time, stations settled)} so they can be compared.
+    #the hierarchy is only included once it has been built
+    def compareModes(self, ID1, ID2):
+        results = {}
+        graph = self.getGraph()
+        modes = ["dijkstra", "astar", "bidirectional"]
+        if self.hierarchy is not None and self.hierarchy.graph is graph:
+            modes.append("hierarchy")
+        for mode in modes:
+            path = self.searchRoute(graph, ID1, ID2, mode)
+            results[mode] = (None if path is None else path[1], self.lastSettled)
+        return results
+    
+    #find the routes from one station to many with a single search. yields (destination, path) for every destination,
+    #where path is what findRoute would return. destinations are yielded as soon as the search settles them, so the closest come first
+    def findRoutes(self, origin, destinations):
+        graph = self.getGraph()
+        version = self.closureVersion
+        
+        #destinations still to be found, grouped by graph index in case the same station is asked for twice
+        pending = {}
+        for ID in destinations:
+            error = self.routeError(origin, ID)
+            if error is not None:
+                yield ID, error
+                continue
+            found, path = self.routeCache.lookup((origin, ID, version))
+            if found:
+                yield ID, (None if path is None else (list(path[0]), path[1]))
+                continue
+            pending.setdefault(graph.index[ID], []).append(ID)
+        if not pending:
+            return
+        
+        source = graph.index[origin]
+        found, tree = self.treeCache.lookup((origin, version))
+        if found:
+            distance, predecessor = tree
+            searchResults = ((node, distance[node]) for node in list(pending) if node in distance)
+        else:
+            predecessor = {}
+            searchResults = graph.search(source, graph.closedMask(self.closedLines), predecessor)
+        
+        for node, d in searchResults:
+            if node in pending:
+                path = (graph.path(predecessor, source, node), d)
+                for ID in pending.pop(node):
+                    self.routeCache.store((origin, ID, version), path)
+                    yield ID, (list(path[0]), path[1])
+                if not pending:
+                    return
+        
+        #whatever is left can't be reached
+        for IDs in pending.values():
+            for ID in IDs:
+                self.routeCache.store((origin, ID, version), None)
+                yield ID, None
+    
+    #find the routes between every origin and every destination, with one search per origin. yields (origin, destination, path)
+    def odMatrix(self, origins, destinations):
+        destinations = list(destinations)
+        for origin in origins:
+            for ID, path in self.findRoutes(origin, destinations):
+                yield origin, ID, path
+
+
+class ContractionHierarchy:
+    """A customizable contraction hierarchy over a CompactGraph for point to point queries.
+    Stations are ranked by a nested dissection of the network and every station is joined to the higher ranked stations it would be
+    contracted into. This shortcut structure doesn't depend on travel times or closures, so when lines or stations are opened or closed
+    only the weights of the affected arcs are recomputed ("customized") rather than rebuilding the hierarchy.
+    Queries walk up the elimination tree from both stations and unpack the shortcuts back into stations.
+    How fast it is depends on how small the separators the network splits on are, since a query searches every separator above both
+    stations. Sparse, irregular networks like London split on a few stations and their queries are much faster than Dijkstra, but
+    grid-like and radial networks have separators that grow with the square root of their size, and so do the cost of their queries,
+    customization and build. benchmarks/suite.py --hierarchy measures them"""
+    infinity = 9999999999
+    
+    def __init__(self, graph, closedLines = ()):
+        self.graph = graph
+        n = graph.size()
+        self.activeSeen = bytes(graph.active)
+        self.lastRelaxed = 0
+        
+        #the undirected neighbours of every station, ignoring parallel connections
+        neighbours = [set() for i in range(n)]
+        for i in range(n):
+            for k in range(graph.offsets[i], graph.offsets[i + 1]):
+                j = graph.targets[k]
+                if j != i:
+                    neighbours[i].add(j)
+                    neighbours[j].add(i)
+        
+        #eliminate the stations in nested dissection order. the remaining neighbours of each eliminated station are joined to each other,
+        #and they become its upward arcs
+        order = self.dissect(list(range(n)), neighbours)
+        self.rank = [0]*n
+        for position, x in enumerate(order):
+            self.rank[x] = position
+        self.up = [None]*n
+        for x in order:
+            upper = neighbours[x]
+            self.up[x] = list(upper)
+            for y in upper:
+                neighbours[y].discard(x)
+                neighbours[y].update(upper)
+                neighbours[y].discard(y)
+            neighbours[x] = None
+        
+        #number the arcs. arcLow is always the lower ranked end. each station's upward arcs are numbered together, sorted by the rank of
+        #their other end, and arcTo maps each station's upper neighbours to the arcs joining them
+        self.arcLow = []
+        self.arcHigh = []
+        self.arcTo = [None]*n
+        self.upArcs = [None]*n
+        self.lower = [[] for i in range(n)]
+        for x in order:
+            self.up[x].sort(key = self.rank.__getitem__)
+            first = len(self.arcLow)
+            self.arcTo[x] = {y: first + offset for offset, y in enumerate(self.up[x])}
+            self.upArcs[x] = range(first, first + len(self.up[x]))
+            for y in self.up[x]:
+                self.arcLow.append(x)
+                self.arcHigh.append(y)
+                self.lower[y].append(x)
+        
+        #the parent of a station in the elimination tree is its lowest ranked upper neighbour. every station a query can reach
+        #going upwards from a station is one of its ancestors
+        self.parent = [self.up[x][0] if self.up[x] else -1 for x in range(n)]
+        
+        #the original connections behind each arc, as (connection index, direction). direction 0 runs from arcLow to arcHigh
+        arcCount = len(self.arcLow)
+        self.inputs = [[] for a in range(arcCount)]
+        self.lineArcs = [set() for code in range(len(graph.lineIds))]
+        #every arc touching a station, shortcuts included. a closed station's arcs are all given infinite weight so no route passes through it
+        self.stationArcs = [set(self.upArcs[i]) for i in range(n)]
+        for a in range(arcCount):
+            self.stationArcs[self.arcHigh[a]].add(a)
+        for i in range(n):
+            for k in range(graph.offsets[i], graph.offsets[i + 1]):
+                j = graph.targets[k]
+                if j == i:
+                    continue
+                if self.rank[i] < self.rank[j]:
+                    a = self.arcTo[i][j]
+                    self.inputs[a].append((k, 0))
+                else:
+                    a = self.arcTo[j][i]
+                    self.inputs[a].append((k, 1))
+                self.lineArcs[graph.lines[k]].add(a)
+        
+        self.inputUp = [self.infinity]*arcCount
+        self.inputDown = [self.infinity]*arcCount
+        self.weightUp = [self.infinity]*arcCount
+        self.weightDown = [self.infinity]*arcCount
+        self.closed = graph.closedMask(closedLines)
+        self.dirty = set(range(arcCount))
+        self.customize()
+    
+    #order stations for contraction by nested dissection: split them in two, order each part, and put the stations that separate the
+    #parts last. small separators keep the number of shortcuts and the query search spaces small, so several cuts are tried - across
+    #the coordinates in four directions, and across the hops out from the middle station and from the station furthest from it - and
+    #the one with the smallest separator is kept. parts that aren't connected to each other are ordered on their own
+    def dissect(self, nodes, neighbours):
+        if len(nodes) <= 32:
+            return self.minimumDegree(nodes, neighbours)
+        cell = set(nodes)
+        if len(self.hops(nodes[0], cell, neighbours)) < len(nodes):
+            order = []
+            while cell:
+                part = self.hops(next(iter(cell)), cell, neighbours)
+                cell.difference_update(part)
+                order.extend(self.dissect(list(part), neighbours))
+            return order
+        
+        graph = self.graph
+        lats = graph.lats
+        longs = graph.longs
+        middleLat = sum(lats[x] for x in nodes)/len(nodes)
+        middleLong = sum(longs[x] for x in nodes)/len(nodes)
+        middle = min(nodes, key = lambda x: (lats[x] - middleLat)**2 + (longs[x] - middleLong)**2)
+        fromMiddle = self.hops(middle, cell, neighbours)
+        furthest = max(fromMiddle, key = fromMiddle.__getitem__)
+        keys = [lats.__getitem__, longs.__getitem__, lambda x: lats[x] + longs[x], lambda x: lats[x] - longs[x],
+                fromMiddle.__getitem__, self.hops(furthest, cell, neighbours).__getitem__]
+        best = None
+        for key in keys:
+            ordered = sorted(nodes, key = key)
+            #cut anywhere from 40% to 60% of the way along
+            for twentieth in range(8, 13):
+                cut = len(ordered)*twentieth//20
+                separator = self.separator(ordered[:cut], ordered[cut:], neighbours)
+                if best is None or len(separator) < len(best[0]):
+                    best = (separator, ordered, cut)
+        separator, nodes, cut = best
+        inSeparator = set(separator)
+        first = [x for x in nodes[:cut] if x not in inSeparator]
+        second = [x for x in nodes[cut:] if x not in inSeparator]
+        return self.dissect(first, neighbours) + self.dissect(second, neighbours) + separator
+    
+    #return the hops from start to each of the stations in cell it's connected to, without leaving cell
+    def hops(self, start, cell, neighbours):
+        hops = {start: 0}
+        frontier = [start]
+        count = 0
+        while frontier:
+            count += 1
+            reached = []
+            for x in frontier:
+                for y in neighbours[x]:
+                    if y in cell and y not in hops:
+                        hops[y] = count
+                        reached.append(y)
+            frontier = reached
+        return hops
+    
+    #return the fewest stations that between them touch every connection from first to second, so taking them out splits the two.
+    #by Konig's theorem they are the first side's stations that can't be reached by alternating paths from the ones a maximum
+    #matching of the connections leaves unmatched, and the second side's stations that can
+    def separator(self, first, second, neighbours):
+        inSecond = set(second)
+        crossing = {}
+        for x in first:
+            across = [y for y in neighbours[x] if y in inSecond]
+            if across:
+                crossing[x] = across
+        
+        #grow the matching one augmenting path at a time
+        matchOf = {}
+        matchedTo = {}
+        for x in crossing:
+            reachedFrom = {}
+            stack = [x]
+            free = None
+            while stack and free is None:
+                u = stack.pop()
+                for y in crossing[u]:
+                    if y in reachedFrom:
+                        continue
+                    reachedFrom[y] = u
+                    if y not in matchedTo:
+                        free = y
+                        break
+                    stack.append(matchedTo[y])
+            #flip the path, from the unmatched station found back to x
+            y = free
+            while y is not None:
+                u = reachedFrom[y]
+                previous = matchOf.get(u)
+                matchOf[u] = y
+                matchedTo[y] = u
+                y = previous
+        
+        reachedFirst = set(x for x in crossing if x not in matchOf)
+        reachedSecond = set()
+        stack = list(reachedFirst)
+        while stack:
+            u = stack.pop()
+            for y in crossing[u]:
+                if y not in reachedSecond:
+                    reachedSecond.add(y)
+                    v = matchedTo[y]
+                    if v not in reachedFirst:
+                        reachedFirst.add(v)
+                        stack.append(v)
+        return [x for x in crossing if x not in reachedFirst] + [y for y in matchedTo if y in reachedSecond]
+    
+    #order a few stations by repeatedly eliminating the one with the fewest remaining neighbours among them
+    def minimumDegree(self, nodes, neighbours):
+        cell = set(nodes)
+        remaining = {x: neighbours[x] & cell for x in nodes}
+        order = []
+        while remaining:
+            x = min(remaining, key = lambda x: len(remaining[x]))
+            joined = remaining.pop(x)
+            for y in joined:
+                remaining[y].discard(x)
+                remaining[y].update(joined)
+                remaining[y].discard(y)
+            order.append(x)
+        return order
+    
+    #work out the weight of an arc from its open original connections
+    def inputWeights(self, a):
+        graph = self.graph
+        up = self.infinity
+        down = self.infinity
+        if graph.active[self.arcLow[a]] and graph.active[self.arcHigh[a]]:
+            for k, direction in self.inputs[a]:
+                if self.closed[graph.lines[k]]:
+                    continue
+                if direction == 0:
+                    up = min(up, graph.times[k])
+                else:
+                    down = min(down, graph.times[k])
+        return up, down
+    
+    #bring the hierarchy up to date with the closed lines and the graph's active stations, marking the arcs that change as dirty
+    def update(self, closedLines):
+        closed = self.graph.closedMask(closedLines)
+        if closed != self.closed:
+            for code in range(len(closed)):
+                if closed[code] != self.closed[code]:
+                    self.dirty.update(self.lineArcs[code])
+            self.closed = closed
+        active = self.graph.active
+        if active != self.activeSeen:
+            for i in range(len(active)):
+                if active[i] != self.activeSeen[i]:
+                    self.dirty.update(self.stationArcs[i])
+            self.activeSeen = bytes(active)
+    
+    #recompute the weights of the dirty arcs, lowest ranked first. an arc's weight is the better of its own connections and the
+    #routes through each lower ranked station joined to both ends. when an arc changes, the arcs above it whose lower triangles it's in
+    #are only recomputed if the route through it now beats them or was what their weight came from, so a closure only reaches the
+    #arcs whose weights it really changes
+    def customize(self):
+        if not self.dirty:
+            return
+        rank = self.rank
+        arcLow = self.arcLow
+        arcHigh = self.arcHigh
+        arcTo = self.arcTo
+        lower = self.lower
+        active = self.graph.active
+        weightUp = self.weightUp
+        weightDown = self.weightDown
+        queue = [(rank[arcLow[a]], a) for a in self.dirty]
+        heapq.heapify(queue)
+        queued = self.dirty
+        self.dirty = set()
+        while queue:
+            r, a = heapq.heappop(queue)
+            queued.discard(a)
+            x = arcLow[a]
+            y = arcHigh[a]
+            up, down = self.inputWeights(a)
+            self.inputUp[a] = up
+            self.inputDown[a] = down
+            #lower triangles: stations m below both x and y, with arcs m-x and m-y
+            if active[x] and active[y]:
+                near, far = (x, y) if len(lower[x]) <= len(lower[y]) else (y, x)
+                for m in lower[near]:
+                    arcs = arcTo[m]
+                    if far in arcs:
+                        mx = arcs[x]
+                        my = arcs[y]
+                        through = weightDown[mx] + weightUp[my]
+                        if through < up:
+                            up = through
+                        through = weightDown[my] + weightUp[mx]
+                        if through < down:
+                            down = through
+            oldUp = weightUp[a]
+            oldDown = weightDown[a]
+            if up == oldUp and down == oldDown:
+                continue
+            weightUp[a] = up
+            weightDown[a] = down
+            #the arcs between y and the other stations z above x have this arc in a lower triangle
+            arcs = arcTo[x]
+            for z in self.up[x]:
+                if z == y:
+                    continue
+                xz = arcs[z]
+                if rank[y] < rank[z]:
+                    b = arcTo[y][z]
+                    upVia, oldUpVia = down + weightUp[xz], oldDown + weightUp[xz]
+                    downVia, oldDownVia = weightDown[xz] + up, weightDown[xz] + oldUp
+                else:
+                    b = arcTo[z][y]
+                    upVia, oldUpVia = weightDown[xz] + up, weightDown[xz] + oldUp
+                    downVia, oldDownVia = down + weightUp[xz], oldDown + weightUp[xz]
+                if b in queued:
+                    continue
+                bUp = weightUp[b]
+                bDown = weightDown[b]
+                if upVia < bUp or downVia < bDown or (oldUpVia == bUp and upVia > bUp) or (oldDownVia == bDown and downVia > bDown):
+                    queued.add(b)
+                    heapq.heappush(queue, (rank[arcLow[b]], b))
+    
+    #find the fastest route between two graph indices. returns (route as graph indices, distance, stations visited),
+    #with the route None if the target can't be reached
+    def query(self, source, target, closedLines):
+        self.update(closedLines)
+        self.customize()
+        upArcs = self.upArcs
+        arcHigh = self.arcHigh
+        weightUp = self.weightUp
+        weightDown = self.weightDown
+        infinity = self.infinity
+        
+        #a search only reaches the ancestors of the station it starts from in the elimination tree. below the station where the two
+        #paths up the tree join only one search reaches a station, so those are searched from separately, then the shared stations are
+        #walked together, lowest ranked first. a search stops relaxing arcs once its distance to a station is no better than the best
+        #route found
+        forwardPath = self.ancestors(source)
+        backwardPath = self.ancestors(target)
+        shared = 0
+        while shared < min(len(forwardPath), len(backwardPath)) and forwardPath[-1 - shared] == backwardPath[-1 - shared]:
+            shared += 1
+        forward = dict.fromkeys(forwardPath, infinity)
+        backward = dict.fromkeys(backwardPath, infinity)
+        forward[source] = 0
+        backward[target] = 0
+        forwardVia = {}
+        backwardVia = {}
+        relaxed = 0
+        for x in forwardPath[:len(forwardPath) - shared]:
+            d = forward[x]
+            if d < infinity:
+                relaxed += len(upArcs[x])
+                for a in upArcs[x]:
+                    distance = d + weightUp[a]
+                    z = arcHigh[a]
+                    if distance < forward[z]:
+                        forward[z] = distance
+                        forwardVia[z] = a
+        for x in backwardPath[:len(backwardPath) - shared]:
+            d = backward[x]
+            if d < infinity:
+                relaxed += len(upArcs[x])
+                for a in upArcs[x]:
+                    distance = d + weightDown[a]
+                    z = arcHigh[a]
+                    if distance < backward[z]:
+                        backward[z] = distance
+                        backwardVia[z] = a
+        best = infinity
+        meeting = None
+        for x in forwardPath[len(forwardPath) - shared:]:
+            d = forward[x]
+            e = backward[x]
+            if d + e < best:
+                best = d + e
+                meeting = x
+            if d < best:
+                relaxed += len(upArcs[x])
+                for a in upArcs[x]:
+                    distance = d + weightUp[a]
+                    z = arcHigh[a]
+                    if distance < forward[z]:
+                        forward[z] = distance
+                        forwardVia[z] = a
+            if e < best:
+                relaxed += len(upArcs[x])
+                for a in upArcs[x]:
+                    distance = e + weightDown[a]
+                    z = arcHigh[a]
+                    if distance < backward[z]:
+                        backward[z] = distance
+                        backwardVia[z] = a
+        self.lastRelaxed = relaxed
+        visited = len(forwardPath) + len(backwardPath)
+        if meeting is None:
+            return (None, None, visited)
+        
+        #arcs from the source up to the meeting station, then back down to the target
+        route = [meeting]
+        x = meeting
+        while x != source:
+            a = forwardVia[x]
+            route[:0] = self.unpack(a, 0)[:-1]
+            x = self.arcLow[a]
+        x = meeting
+        while x != target:
+            a = backwardVia[x]
+            route.extend(self.unpack(a, 1)[1:])
+            x = self.arcLow[a]
+        return (route, best, visited)
+    
+    #return a station and its ancestors in the elimination tree, lowest ranked first
+    def ancestors(self, x):
+        path = []
+        parent = self.parent
+        while x != -1:
+            path.append(x)
+            x = parent[x]
+        return path
+    
+    #return (arcs relaxed, 0) by the last query. closures are folded into the arc weights, so no arcs are skipped because of them
+    def lastConnections(self):
+        return (self.lastRelaxed, 0)
+    
+    #expand an arc into the stations it stands for. direction 0 goes from arcLow to arcHigh, 1 goes from arcHigh to arcLow
+    def unpack(self, a, direction):
+        route = []
+        stack = [(a, direction)]
+        while stack:
+            a, direction = stack.pop()
+            x = self.arcLow[a]
+            y = self.arcHigh[a]
+            start, end = (x, y) if direction == 0 else (y, x)
+            weight = self.weightUp[a] if direction == 0 else self.weightDown[a]
+            inputWeight = self.inputUp[a] if direction == 0 else self.inputDown[a]
+            if weight == inputWeight:
+                if not route:
+                    route.append(start)
+                route.append(end)
+                continue
+            #find the lower station the shortcut passes through. the second half is pushed first so the first half is expanded first
+            for m in self.lower[x]:
+                arcs = self.arcTo[m]
+                if y not in arcs:
+                    continue
+                mx = arcs[x]
+                my = arcs[y]
+                if direction == 0 and self.weightDown[mx] + self.weightUp[my] == weight:
+                    stack.append((my, 0))
+                    stack.append((mx, 1))
+                    break
+                if direction == 1 and self.weightDown[my] + self.weightUp[mx] == weight:
+                    stack.append((mx, 0))
+                    stack.append((my, 1))
+                    break
+        return route
+
+
+class DynamicTree:
+    """A full shortest path tree from one station, kept as arrays indexed by graph index. parentEdge is the connection each station is reached by"""
+    __slots__ = ("source", "distance", "parent", "parentEdge")
+    
+    def __init__(self, source, n):
+        self.source = source
+        self.distance = [DynamicTrees.infinity]*n
+        self.parent = array("i", [-1])*n
+        self.parentEdge = array("q", [-1])*n
+        self.distance[source] = 0
+    
+    #return the route from the tree's source to target as graph indices, or None if it can't be reached
+    def path(self, target):
+        if self.distance[target] >= DynamicTrees.infinity:
+            return None
+        route = []
+        currentNode = target
+        while (currentNode != self.source):
+            route.append(currentNode)
+            currentNode = self.parent[currentNode]
+        route.append(self.source)
+        route.reverse()
+        return route
+
+
+
+
+class DynamicTrees:
+    """Shortest path trees for the most queried starting stations, repaired in place when stations or lines open and close.
+    A closure only resets and re-searches the subtrees hanging off the closed station or connections. A reopening only
+    searches outwards from the reopened station or connections while that improves distances"""
+    infinity = 9999999999
+    
+    def __init__(self, graph, closedLines = (), capacity = 16, hotThreshold = 3):
+        self.graph = graph
+        self.capacity = capacity
+        self.hotThreshold = hotThreshold
+        self.trees = OrderedDict()
+        self.queryCounts = {}
+        self.closed = graph.closedMask(closedLines)
+        self.activeSeen = bytes(graph.active)
+        
+        #the station each connection starts from, and the connections on each line
+        self.edgeSource = array("i", [0])*len(graph.targets)
+        self.lineEdges = [[] for code in range(len(graph.lineIds))]
+        for i in range(graph.size()):
+            for k in range(graph.offsets[i], graph.offsets[i + 1]):
+                self.edgeSource[k] = i
+                self.lineEdges[graph.lines[k]].append(k)
+        self.repairs = 0
+    
+    #return the tree from a station. a tree is built once the station has been asked for hotThreshold times, and the least
+    #recently used tree is dropped when there are more than capacity. returns None if the station has no tree yet
+    def lookup(self, source):
+        tree = self.trees.get(source)
+        if tree is not None:
+            self.trees.move_to_end(source)
+            return tree
+        self.queryCounts[source] = self.queryCounts.get(source, 0) + 1
+        if self.queryCounts[source] < self.hotThreshold or not self.graph.active[source]:
+            return None
+        tree = DynamicTree(source, self.graph.size())
+        self.grow(tree, [(0, source)])
+        self.trees[source] = tree
+        if len(self.trees) > self.capacity:
+            self.trees.popitem(last = False)
+        return tree
+    
+    #bring the trees up to date with the closed lines and the graph's active stations. closures are repaired before reopenings,
+    #so every distance is a real route length when the reopenings are searched from
+    def sync(self, closedLines):
+        graph = self.graph
+        closed = graph.closedMask(closedLines)
+        closedStations = []
+        openedStations = []
+        if graph.active != self.activeSeen:
+            for i in range(len(graph.active)):
+                if graph.active[i] != self.activeSeen[i]:
+                    (openedStations if graph.active[i] else closedStations).append(i)
+            self.activeSeen = bytes(graph.active)
+        closingLines = [code for code in range(len(closed)) if closed[code] and not self.closed[code]]
+        openingLines = [code for code in range(len(closed)) if self.closed[code] and not closed[code]]
+        if not (closedStations or openedStations or closingLines or openingLines):
+            return
+        
+        #a tree whose own station has closed is dropped, and rebuilt if the station is asked for again after it opens
+        for i in closedStations:
+            self.trees.pop(i, None)
+        for code in closingLines:
+            self.closed[code] = 1
+            for tree in self.trees.values():
+                roots = [graph.targets[k] for k in self.lineEdges[code] if tree.parentEdge[graph.targets[k]] == k]
+                self.removeSubtrees(tree, roots)
+        if closedStations:
+            for tree in self.trees.values():
+                self.removeSubtrees(tree, closedStations)
+        for code in openingLines:
+            self.closed[code] = 0
+            for tree in self.trees.values():
+                queue = []
+                for k in self.lineEdges[code]:
+                    self.relax(tree, k, queue)
+                self.grow(tree, queue)
+        if openedStations:
+            for tree in self.trees.values():
+                queue = []
+                for i in openedStations:
+                    self.relaxInto(tree, i, queue)
+                self.grow(tree, queue)
+        self.repairs += 1
+    
+    #try to improve the distance at the end of connection k from the distance at its start
+    def relax(self, tree, k, queue):
+        graph = self.graph
+        u = self.edgeSource[k]
+        v = graph.targets[k]
+        if tree.distance[u] >= self.infinity or self.closed[graph.lines[k]] or not graph.active[v]:
+            return
+        newDistance = tree.distance[u] + graph.times[k]
+        if newDistance < tree.distance[v]:
+            tree.distance[v] = newDistance
+            tree.parent[v] = u
+            tree.parentEdge[v] = k
+            heapq.heappush(queue, (newDistance, v))
+    
+    #try to improve the distance of station v from every connection into it
+    def relaxInto(self, tree, v, queue):
+        offsets, sources, times, lines, edges = self.graph.reverse()
+        for position in range(offsets[v], offsets[v + 1]):
+            self.relax(tree, edges[position], queue)
+    
+    #Dijkstra's algorithm from the stations in the queue, only following connections that improve a distance
+    def grow(self, tree, queue):
+        graph = self.graph
+        offsets = graph.offsets
+        targets = graph.targets
+        times = graph.times
+        lines = graph.lines
+        active = graph.active
+        closed = self.closed
+        distance = tree.distance
+        heapq.heapify(queue)
+        while queue:
+            d, node = heapq.heappop(queue)
+            if d > distance[node]:
+                continue
+            for k in range(offsets[node], offsets[node + 1]):
+                if closed[lines[k]]:
+                    continue
+                neighbour = targets[k]
+                if not active[neighbour]:
+                    continue
+                newDistance = d + times[k]
+                if newDistance < distance[neighbour]:
+                    distance[neighbour] = newDistance
+                    tree.parent[neighbour] = node
+                    tree.parentEdge[neighbour] = k
+                    heapq.heappush(queue, (newDistance, neighbour))
+    
+    #reset every station in the subtrees under the roots, then give each one its best distance from a station outside them and search on from there
+    def removeSubtrees(self, tree, roots):
+        graph = self.graph
+        distance = tree.distance
+        affected = set()
+        stack = [root for root in roots if distance[root] < self.infinity]
+        while stack:
+            v = stack.pop()
+            if v in affected:
+                continue
+            affected.add(v)
+            for k in range(graph.offsets[v], graph.offsets[v + 1]):
+                child = graph.targets[k]
+                if tree.parent[child] == v and child not in affected:
+                    stack.append(child)
+        if not affected:
+            return
+        for v in affected:
+            distance[v] = self.infinity
+            tree.parent[v] = -1
+            tree.parentEdge[v] = -1
+        queue = []
+        for v in affected:
+            self.relaxInto(tree, v, queue)
+        self.grow(tree, queue)
+
+
+#state of a worker process started by Network.parallelODMatrix
+odWorker = {}
+
+#memory-map the graph file in a new worker process
+def startODWorker(path, closed, targets):
+    odWorker["graph"] = CompactGraph.load(path)
+    odWorker["closed"] = closed
+    odWorker["targets"] = targets
+
+#search from each origin in a chunk. for each origin returns (times, ends, nodes) arrays in the order of the targets:
+#the route to target k is nodes[ends[k-1]:ends[k]] as graph indices, and its time is times[k], or -1 if it can't be reached.
+#arrays are used because they are much quicker to send back to the main process than lists of lists
+def solveODChunk(origins):
+    graph = odWorker["graph"]
+    targets = odWorker["targets"]
+    results = []
+    for source in origins:
+        predecessor = {}
+        distance = {}
+        pending = set(targets)
+        for node, d in graph.search(source, odWorker["closed"], predecessor):
+            distance[node] = d
+            pending.discard(node)
+            if not pending:
+                break
+        times = array("i")
+        ends = array("i")
+        nodes = array("i")
+        for target in targets:
+            if target in distance:
+                start = len(nodes)
+                currentNode = target
+                while (currentNode != source):
+                    nodes.append(currentNode)
+                    currentNode = predecessor[currentNode]
+                nodes.append(source)
+                nodes[start:] = nodes[start:][::-1]
+                times.append(distance[target])
+            else:
+                times.append(-1)
+            ends.append(len(nodes))
+        results.append((times, ends, nodes))
+    return results
+
+
+class TravelTimeMatrix:
+    """Travel times between every pair of stations, with a next-hop matrix for rebuilding routes. The matrices are saved as
+    .npy files and memory-mapped when opened, so a lookup only reads the parts of the files it needs"""
+    distanceFile = "distances.npy"
+    nextHopFile = "nexthop.npy"
+    stationsFile = "stations.json"
+    
+    def __init__(self, directory):
+        with open(os.path.join(directory, self.stationsFile)) as f:
+            info = json.load(f)
+        self.ids = info["stations"]
+        self.closedLines = info["closedLines"]
+        self.closedStations = info["closedStations"]
+        self.index = {ID: i for i, ID in enumerate(self.ids)}
+        self.n = len(self.ids)
+        self.distances = self.mapArray(os.path.join(directory, self.distanceFile))
+        self.nextHops = self.mapArray(os.path.join(directory, self.nextHopFile))
+    
+    #open a directory written by precompute
+    @classmethod
+    def open(cls, directory):
+        return cls(directory)
+    
+    #run Dijkstra's algorithm from every station and write the distance and next-hop matrices one row at a time.
+    #unreachable pairs are stored as -1 in both matrices
+    @classmethod
+    def precompute(cls, network, directory):
+        graph = network.getGraph()
+        closed = graph.closedMask(network.closedLines)
+        n = graph.size()
+        os.makedirs(directory, exist_ok = True)
+        
+        with open(os.path.join(directory, cls.distanceFile), "wb") as distanceOut, open(os.path.join(directory, cls.nextHopFile), "wb") as nextHopOut:
+            cls.writeHeader(distanceOut, "i", (n, n))
+            cls.writeHeader(nextHopOut, "i", (n, n))
+            for source in range(n):
+                distances = array("i", [-1])*n
+                nextHops = array("i", [-1])*n
+                if graph.active[source]:
+                    predecessor = {}
+                    #stations are settled after their predecessors, so each one's first hop can be copied from its predecessor's
+                    for node, d in graph.search(source, closed, predecessor):
+                        distances[node] = d
+                        if node == source:
+                            nextHops[node] = node
+                        elif predecessor[node] == source:
+                            nextHops[node] = node
+                        else:
+                            nextHops[node] = nextHops[predecessor[node]]
+                distances.tofile(distanceOut)
+                nextHops.tofile(nextHopOut)
+        
+        with open(os.path.join(directory, cls.stationsFile), "w") as f:
+            closedStations = [graph.ids[i] for i in range(n) if not graph.active[i]]
+            json.dump({"stations": graph.ids, "closedLines": list(network.closedLines), "closedStations": closedStations}, f)
+        return cls(directory)
+    
+    #write a version 1.0 .npy header for a C-ordered array, so the files can also be opened with numpy.load(mmap_mode = "r")
+    @staticmethod
+    def writeHeader(f, typecode, shape):
+        order = "<" if sys.byteorder == "little" else ">"
+        header = "{'descr': '%s%s%d', 'fortran_order': False, 'shape': %r, }" % (order, "i" if typecode.islower() else "u", array(typecode).itemsize, shape)
+        #the magic string, version, length and header together are padded to a multiple of 64 bytes
+        padding = 64 - (10 + len(header) + 1) % 64
+        header = header + " "*padding + "\n"
+        f.write(b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1"))
+    
+    #memory-map a .npy file written by precompute and return its data as a flat memoryview of ints
+    @staticmethod
+    def mapArray(path):
+        with open(path, "rb") as f:
+            if f.read(8) != b"\x93NUMPY\x01\x00":
+                raise ValueError(path + " is not a version 1.0 .npy file")
+            headerLength = int.from_bytes(f.read(2), "little")
+            header = ast.literal_eval(f.read(headerLength).decode("latin1"))
+            if header["descr"][1:] != "i%d" % array("i").itemsize or header["fortran_order"]:
+                raise ValueError(path + " does not hold C-ordered ints")
+            mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        return memoryview(mapped)[10 + headerLength:].cast("i")
+    
+    #return the travel time between two stations, or None if there is no route
+    def travelTime(self, ID1, ID2):
+        d = self.distances[self.index[ID1]*self.n + self.index[ID2]]
+        if d < 0:
+            return None
+        return d
+    
+    #return (route, time) between two stations, following the next-hop matrix one station at a time.
+    #returns None if there is no route, like Network.findRoute
+    def findRoute(self, ID1, ID2):
+        try:
+            source = self.index[ID1]
+            target = self.index[ID2]
+        except KeyError:
+            return (["Destination or starting station not found."], 0)
+        d = self.distances[source*self.n + target]
+        if d < 0:
+            return None
+        route = [ID1]
+        currentNode = source
+        while (currentNode != target):
+            currentNode = self.nextHops[currentNode*self.n + target]
+            route.append(self.ids[currentNode])
+        return (route, d)
+
+
+#//////////////////////////////////////LOADING//////////////////////////////////////////////
+
+#load a network from its three CSV files, named prefix.stations.csv, prefix.connections.csv and prefix.lines.csv,
+#or from a snapshot file written by Network.save_snapshot
+def loadNetwork(prefix = "london"):
+    if os.path.isfile(prefix):
+        return Network.load_snapshot(prefix)
+    return Network.from_csv(prefix + ".stations.csv", prefix + ".connections.csv", prefix + ".lines.csv")
+
+
+
+#//////////////////////////////////////TIMETABLES//////////////////////////////////////////////
+
+#return a time of day written as HH:MM or HH:MM:SS as seconds after midnight. hours can go past 24 for services after midnight
+def parseTime(text):
+    parts = text.strip().split(":")
+    if len(parts) not in (2, 3):
+        raise ValueError("times should be HH:MM or HH:MM:SS, not " + repr(text))
+    seconds = int(parts[0])*3600 + int(parts[1])*60
+    if len(parts) == 3:
+        seconds += int(parts[2])
+    return seconds
+
+#return seconds after midnight as HH:MM, or HH:MM:SS if they don't fall on a minute
+def formatTime(seconds):
+    text = "%02d:%02d" % (seconds//3600, seconds//60 % 60)
+    if seconds % 60:
+        text += ":%02d" % (seconds % 60)
+    return text
+
+
+class Timetable:
+    """Every departure in a day as a connection from one station to the next, stored as arrays sorted by departure time, for the
+    Connection Scan Algorithm. An earliest arrival query scans forwards once from the departure time and a profile query scans
+    backwards once over the whole day. Stations are numbered as in the network's CompactGraph, and closures are applied as the
+    connections are scanned, so the timetable doesn't change when lines or stations are opened or closed.
+    Each connection belongs to a trip, one train's run along its line, which is used to group a journey into legs"""
+    
+    def __init__(self, ids, lineIds, connections):
+        self.ids = ids
+        self.lineIds = lineIds
+        self.lineCodes = {line: code for code, line in enumerate(lineIds)}
+        #connections are (departure, arrival, order along the trip, from, to, line code, trip) tuples. sorting on the order along the
+        #trip as well means a train's connections stay in order even if one takes no time
+        connections.sort()
+        self.departures = array("i", [c[0] for c in connections])
+        self.arrivals = array("i", [c[1] for c in connections])
+        self.sources = array("i", [c[3] for c in connections])
+        self.targets = array("i", [c[4] for c in connections])
+        self.lines = array("H", [c[5] for c in connections])
+        self.trips = array("i", [c[6] for c in connections])
+    
+    #build a timetable from (line, start, end, headway) service periods, with times in seconds. a train leaves one end of the line every
+    #headway seconds from start until before end, and runs the length of the line, down every branch, taking the connections' times.
+    #the trains in the other direction reach that end at the same intervals. the end a line is run from is the first station with only
+    #one connection on it, and lines given by name are looked up in network.lines
+    @classmethod
+    def fromFrequencies(cls, network, periods):
+        graph = network.getGraph()
+        byLine = defaultdict(list)
+        for line, start, end, headway in periods:
+            line = network.lines.get(line, line)
+            if line not in graph.lineCodes:
+                raise ValueError("the timetable has a line that isn't in the network: " + repr(line))
+            if headway <= 0:
+                raise ValueError("the headway of line " + repr(line) + " must be more than 0")
+            byLine[graph.lineCodes[line]].append((start, end, headway))
+        
+        #the connections of each line, as (from, to, time) with times in seconds
+        edges = defaultdict(list)
+        for i in range(graph.size()):
+            for k in range(graph.offsets[i], graph.offsets[i + 1]):
+                if graph.lines[k] in byLine:
+                    edges[graph.lines[k]].append((i, graph.targets[k], graph.times[k]*60))
+        
+        connections = []
+        trip = 0
+        for code, lineEdges in edges.items():
+            #how long a train takes to reach each station from the end of the line it starts at. a line in several pieces is run from
+            #an end of each piece
+            neighbours = defaultdict(list)
+            for i, j, t in lineEdges:
+                neighbours[i].append((j, t))
+            offset = {}
+            for root in sorted(neighbours, key = lambda i: (len(neighbours[i]) != 1, i)):
+                if root in offset:
+                    continue
+                offset[root] = 0
+                queue = [(0, root)]
+                while queue:
+                    d, i = heapq.heappop(queue)
+                    if d > offset[i]:
+                        continue
+                    for j, t in neighbours[i]:
+                        if j not in offset or d + t < offset[j]:
+                            offset[j] = d + t
+                            heapq.heappush(queue, (d + t, j))
+            length = max(offset.values())
+            
+            #connections away from the starting end are run by the outward trains, and the rest by the trains coming back, which
+            #leave the far end when the outward ones get there
+            for start, end, headway in byLine[code]:
+                for leave in range(start, end, headway):
+                    for i, j, t in lineEdges:
+                        if offset[i] <= offset[j]:
+                            connections.append((leave + offset[i], leave + offset[i] + t, offset[i], i, j, code, trip))
+                        else:
+                            connections.append((leave + length - offset[i], leave + length - offset[i] + t, length - offset[i], i, j, code, trip + 1))
+                    trip += 2
+        return cls(graph.ids, graph.lineIds, connections)
+    
+    #build a timetable from the stops of each trip as (trip, line, station, arrival, departure) rows, with times in seconds and each
+    #trip's stops together and in order. lines can be given by name or ID
+    @classmethod
+    def fromTrips(cls, network, stops):
+        graph = network.getGraph()
+        lineIds = list(graph.lineIds)
+        lineCodes = dict(graph.lineCodes)
+        tripNumbers = {}
+        connections = []
+        previous = None
+        for trip, line, station, arrival, departure in stops:
+            if station not in graph.index:
+                raise ValueError("trip " + repr(trip) + " stops at a station that isn't in the network: " + repr(station))
+            line = network.lines.get(line, line)
+            if line not in lineCodes:
+                lineCodes[line] = len(lineIds)
+                lineIds.append(line)
+            if trip not in tripNumbers:
+                tripNumbers[trip] = len(tripNumbers)
+                order = 0
+            elif previous is None or previous[0] != trip:
+                raise ValueError("the stops of trip " + repr(trip) + " aren't all together")
+            else:
+                if arrival < previous[2]:
+                    raise ValueError("trip " + repr(trip) + " arrives at " + repr(station) + " before it leaves the stop before")
+                connections.append((previous[2], arrival, order, graph.index[previous[1]], graph.index[station], lineCodes[line], tripNumbers[trip]))
+                order += 1
+            previous = (trip, station, departure)
+        return cls(graph.ids, lineIds, connections)
+    
+    #load a timetable for a network from a csv file of service periods, with line, start, end and headway (in minutes) columns,
+    #or of trips, with trip, line, station, arrival and departure columns. times are HH:MM or HH:MM:SS
+    @classmethod
+    def from_csv(cls, network, path):
+        with open(path, newline = "") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            if "headway" in header:
+                lineCol = header.index("line")
+                startCol = header.index("start")
+                endCol = header.index("end")
+                headwayCol = header.index("headway")
+                periods = [(row[lineCol], parseTime(row[startCol]), parseTime(row[endCol]), int(round(float(row[headwayCol])*60))) for row in reader if row]
+                return cls.fromFrequencies(network, periods)
+            if "trip" in header:
+                tripCol = header.index("trip")
+                lineCol = header.index("line")
+                stationCol = header.index("station")
+                arrivalCol = header.index("arrival")
+                departureCol = header.index("departure")
+                stops = [(row[tripCol], row[lineCol], row[stationCol], parseTime(row[arrivalCol]), parseTime(row[departureCol])) for row in reader if row]
+                return cls.fromTrips(network, stops)
+        raise ValueError(path + " has neither a headway column nor a trip column, so it isn't a timetable")
+    
+    #return the number of connections in the timetable
+    def size(self):
+        return len(self.departures)
+    
+    #return a mask indexed by line code that is set for every closed line
+    def closedMask(self, closedLines):
+        mask = bytearray(len(self.lineIds))
+        for line in closedLines:
+            code = self.lineCodes.get(line)
+            if code is not None:
+                mask[code] = 1
+        return mask
+    
+    #find the earliest arrival at target for a traveller at source from departure, scanning forwards from the first connection that
+    #leaves at or after departure until the rest leave too late to help. connections on closed lines and into closed stations are skipped.
+    #returns (the connections taken in order, arrival time), or None if target can't be reached that day
+    def earliestArrival(self, source, target, departure, closed, active):
+        departures = self.departures
+        arrivals = self.arrivals
+        sources = self.sources
+        targets = self.targets
+        lines = self.lines
+        infinity = 9999999999
+        
+        arrival = {source: departure}
+        via = {}
+        best = departure if source == target else infinity
+        for c in range(bisect.bisect_left(departures, departure), len(departures)):
+            if departures[c] >= best:
+                break
+            if arrival.get(sources[c], infinity) > departures[c] or closed[lines[c]]:
+                continue
+            j = targets[c]
+            if arrivals[c] < arrival.get(j, infinity) and active[j]:
+                arrival[j] = arrivals[c]
+                via[j] = c
+                if j == target:
+                    best = arrivals[c]
+        if best == infinity:
+            return None
+        taken = []
+        node = target
+        while node != source:
+            taken.append(via[node])
+            node = sources[via[node]]
+        taken.reverse()
+        return (taken, best)
+    
+    #find every journey from source to target leaving between start and end that no other journey beats, leaving no earlier and arriving
+    #no later, in a single backward scan over the connections. each station keeps a list of (departure, arrival at target) pairs that get
+    #earlier on both as connections are added, so the best way on from a station is found with a binary search. none of the journeys
+    #can arrive after the earliest arrival for leaving at end, so the scan starts from there rather than the end of the day.
+    #returns a list of (departure, arrival) pairs in order of departure
+    def profile(self, source, target, start, end, closed, active):
+        departures = self.departures
+        arrivals = self.arrivals
+        sources = self.sources
+        targets = self.targets
+        lines = self.lines
+        infinity = 9999999999
+        
+        if source == target:
+            return []
+        latest = self.earliestArrival(source, target, end, closed, active)
+        last = len(departures) if latest is None else bisect.bisect_right(departures, latest[1])
+        
+        #the departures are kept negated so that each list is in increasing order for bisect
+        leaving = {}
+        arriving = {}
+        for c in range(last - 1, bisect.bisect_left(departures, start) - 1, -1):
+            if closed[lines[c]]:
+                continue
+            j = targets[c]
+            if j == target:
+                best = arrivals[c]
+            elif j in leaving and active[j]:
+                k = bisect.bisect_right(leaving[j], -arrivals[c]) - 1
+                if k < 0:
+                    continue
+                best = arriving[j][k]
+            else:
+                continue
+            i = sources[c]
+            if i not in leaving:
+                leaving[i] = [-departures[c]]
+                arriving[i] = [best]
+            elif best < arriving[i][-1]:
+                if leaving[i][-1] == -departures[c]:
+                    arriving[i][-1] = best
+                else:
+                    leaving[i].append(-departures[c])
+                    arriving[i].append(best)
+        return [(-leave, arrive) for leave, arrive in zip(reversed(leaving.get(source, [])), reversed(arriving.get(source, []))) if -leave <= end]
+    
+    #return a journey found by earliestArrival as legs, one for each trip taken: (line, from station ID, departure, to station ID, arrival)
+    def legs(self, taken):
+        legs = []
+        trip = None
+        for c in taken:
+            if self.trips[c] == trip:
+                line, origin, departure = legs[-1][:3]
+                legs[-1] = (line, origin, departure, self.ids[self.targets[c]], self.arrivals[c])
+            else:
+                legs.append((self.lineIds[self.lines[c]], self.ids[self.sources[c]], self.departures[c], self.ids[self.targets[c]], self.arrivals[c]))
+            trip = self.trips[c]
+        return legs
+
+
+
+#//////////////////////////////////////MAP DRAWING DATA//////////////////////////////////////////////
+
+class RenderData:
+    """Everything drawing the map needs that doesn't change from frame to frame: station positions normalised to the canvas,
+    each line's connections merged into polylines, the colour of each line and the level of detail tier of each station.
+    Built once, and again only if the map's bounds change. Canvas positions for the current offset and zoom are worked out
+    for every station with toCanvas, or for just the stations being drawn or clicked with positions"""
+    #the size in normalised units of the grid cells used to pick tier 0 stations. each tier after that halves the cell size
+    tierBase = 64
+    tierCount = 8
+    #the longest polyline, in stations, so that culling still works on long lines
+    maxPolyline = 32
+    
+    def __init__(self, network, cwidth, cheight):
+        graph = network.getGraph()
+        self.ids = graph.ids
+        self.index = graph.index
+        self.cheight = cheight
+        self.bounds = self.boundsOf(graph)
+        minLat, latRange, minLong, longRange = self.bounds
+        self.nlat = array("i", [int(((lat - minLat)/latRange)*cheight) for lat in graph.lats])
+        self.nlong = array("i", [int(((long - minLong)/longRange)*cwidth) for long in graph.longs])
+        
+        self.colours = {line: network.lineColours.get(line, "#000000") for line in graph.lineIds}
+        self.buildPolylines(graph)
+        self.buildTiers(graph)
+        
+        #numpy views of nlong and nlat for toCanvas, made the first time it is called. an empty tuple if numpy isn't installed
+        self.arrays = None
+    
+    #merge each line's connections into polylines. a connection and its reverse are drawn once, and runs of stations with only two
+    #neighbours on a line are joined into one polyline. self.polylines holds (line, [station indices]) pairs
+    def buildPolylines(self, graph):
+        lineNeighbours = {}
+        for i in range(graph.size()):
+            for k in range(graph.offsets[i], graph.offsets[i + 1]):
+                j = graph.targets[k]
+                if j != i:
+                    neighbours = lineNeighbours.setdefault(graph.lineIds[graph.lines[k]], {})
+                    neighbours.setdefault(i, set()).add(j)
+                    neighbours.setdefault(j, set()).add(i)
+        
+        self.polylines = []
+        for line in sorted(lineNeighbours, key = str):
+            neighbours = lineNeighbours[line]
+            used = set()
+            #start from the ends and junctions of the line first, then whatever is left is a loop
+            starts = [i for i in neighbours if len(neighbours[i]) != 2] + list(neighbours)
+            for start in starts:
+                for nextStation in neighbours[start]:
+                    if (min(start, nextStation), max(start, nextStation)) in used:
+                        continue
+                    points = [start]
+                    previous = start
+                    current = nextStation
+                    while True:
+                        used.add((min(previous, current), max(previous, current)))
+                        points.append(current)
+                        if len(neighbours[current]) != 2 or current == start:
+                            break
+                        following = [j for j in neighbours[current] if j != previous and (min(current, j), max(current, j)) not in used]
+                        if not following:
+                            break
+                        previous, current = current, following[0]
+                    for first in range(0, len(points) - 1, self.maxPolyline - 1):
+                        self.polylines.append((line, points[first:first + self.maxPolyline]))
+    
+    #give each station a level of detail tier. tier t keeps at most one station in each grid cell of tierBase/2**t units, so stations
+    #only appear once they are far enough apart on screen. stations on the most lines claim their cell first
+    def buildTiers(self, graph):
+        n = graph.size()
+        lineCount = [len({graph.lines[k] for k in range(graph.offsets[i], graph.offsets[i + 1])}) for i in range(n)]
+        order = sorted(range(n), key = lambda i: -lineCount[i])
+        self.tiers = array("B", [self.tierCount])*n
+        for tier in range(self.tierCount):
+            size = self.tierBase/2**tier
+            claimed = set()
+            for i in order:
+                if self.tiers[i] < tier:
+                    claimed.add((self.nlong[i]//size, self.nlat[i]//size))
+            for i in order:
+                if self.tiers[i] == self.tierCount:
+                    cell = (self.nlong[i]//size, self.nlat[i]//size)
+                    if cell not in claimed:
+                        claimed.add(cell)
+                        self.tiers[i] = tier
+    
+    #return the highest tier to show at a zoom, so that tier's grid cells are at least spacing pixels across
+    def maxTier(self, zoom, spacing):
+        if self.tierBase*zoom < spacing:
+            return 0
+        return min(self.tierCount, int(math.log2(self.tierBase*zoom/spacing)))
+    
+    #return (minimum latitude, latitude range, minimum longitude, longitude range) of the stations in a graph
+    @staticmethod
+    def boundsOf(graph):
+        if not graph.size():
+            return (0.0, 1.0, 0.0, 1.0)
+        minLat = min(graph.lats)
+        minLong = min(graph.longs)
+        #a map with every station in a line still needs a non-zero range to divide by
+        return (minLat, (max(graph.lats) - minLat) or 1.0, minLong, (max(graph.longs) - minLong) or 1.0)
+    
+    #return the canvas x and y of every station's centre for an offset and zoom. without numpy there is nothing to do the arithmetic on
+    #whole arrays, so each station is worked out in turn and positions is the better choice for a part of the map
+    def toCanvas(self, xOffset, yOffset, zoom):
+        if self.arrays is None:
+            numpy = importNumpy()
+            self.arrays = () if numpy is None else (numpy.frombuffer(self.nlong, dtype = numpy.intc), numpy.frombuffer(self.nlat, dtype = numpy.intc))
+        if self.arrays:
+            nlongArray, nlatArray = self.arrays
+            return (nlongArray + xOffset)*zoom, (self.cheight - nlatArray + yOffset)*zoom
+        cheight = self.cheight
+        return [(x + xOffset)*zoom for x in self.nlong], [(cheight - y + yOffset)*zoom for y in self.nlat]
+    
+    #return the canvas (x, y) of the centres of some stations for an offset and zoom, as a dict by station index, for when only the
+    #stations near a click or newly in view are needed
+    def positions(self, indexes, xOffset, yOffset, zoom):
+        nlong = self.nlong
+        nlat = self.nlat
+        cheight = self.cheight
+        return {i: ((nlong[i] + xOffset)*zoom, (cheight - nlat[i] + yOffset)*zoom) for i in indexes}
+
+
+
+
+class SpatialGrid:
+    """A uniform grid over map coordinates, for finding what is near a point or inside a rectangle without checking everything.
+    Each key is stored in every cell its bounding box touches"""
+    def __init__(self, cellSize):
+        self.cellSize = cellSize
+        self.cells = defaultdict(list)
+    
+    #return the cells covering a rectangle
+    def cellsIn(self, x1, y1, x2, y2):
+        size = self.cellSize
+        for cx in range(int(min(x1, x2)//size), int(max(x1, x2)//size) + 1):
+            for cy in range(int(min(y1, y2)//size), int(max(y1, y2)//size) + 1):
+                yield (cx, cy)
+    
+    #add a key covering a rectangle. a point is a rectangle with no size
+    def insert(self, key, x1, y1, x2, y2):
+        for cell in self.cellsIn(x1, y1, x2, y2):
+            self.cells[cell].append(key)
+    
+    #return the keys in the cells covering a rectangle. keys near the rectangle's edges may not be inside it
+    def query(self, x1, y1, x2, y2):
+        found = set()
+        for cell in self.cellsIn(x1, y1, x2, y2):
+            if cell in self.cells:
+                found.update(self.cells[cell])
+        return found
+
+
+#//////////////////////////////////////STATION NAMES//////////////////////////////////////////////
+
+#what is left out of names when they are matched: everything but letters, digits and spaces, except hyphens and slashes, which
+#separate words
+punctuation = re.compile(r"[^\w\s/-]|_")
+separators = re.compile(r"[/-]")
+
+class StationNames:
+    """An index of station names for resolving what someone typed, and suggesting stations as they type, without looking at every name.
+    Names are matched ignoring case, punctuation and repeated spaces. The normalised names are kept sorted, so those starting with what
+    was typed are found with a binary search, and so are the words within them, so "cross" finds King's Cross. The sorted names are
+    also a trie: the names starting with any prefix are next to each other, and the letters that can follow it are found by binary
+    search. Typing mistakes are found by walking that trie with a row of the edit distance table for each prefix, so the work depends
+    on how many prefixes are within a few edits of the input rather than on how many names there are"""
+    
+    def __init__(self, stations):
+        #the station IDs and the name as written for each normalised name
+        self.ids = {}
+        self.display = {}
+        for ID, station in stations.items():
+            key = self.normalise(station.getName())
+            self.ids.setdefault(key, []).append(ID)
+            self.display.setdefault(key, station.getName())
+        self.names = sorted(self.ids)
+        #(word, name index) for every word of every name but the first, sorted, for matching the start of later words
+        self.words = sorted((word, i) for i, name in enumerate(self.names) for word in name.split(" ")[1:])
+    
+    #return a name in lower case with punctuation removed and spaces tidied, as it is indexed
+    @staticmethod
+    def normalise(name):
+        return " ".join(separators.sub(" ", punctuation.sub("", name.lower())).split())
+    
+    #return how many edits are allowed in a typing mistake in text of this length
+    @staticmethod
+    def allowedEdits(length):
+        if length < 4:
+            return 0
+        return 1 if length < 8 else 2
+    
+    #return up to limit normalised names matching normalised text, best first, as (edits, name) pairs. names starting with the text come
+    #first, then names with a later word starting with it, both in alphabetical order, then names that start with something a few edits
+    #from the text, fewest edits first
+    def matches(self, text, limit):
+        found = []
+        seen = set()
+        if not text:
+            return found
+        start = bisect.bisect_left(self.names, text)
+        for k in range(start, min(start + limit, len(self.names))):
+            if not self.names[k].startswith(text):
+                break
+            found.append((0, self.names[k]))
+            seen.add(k)
+        
+        if len(found) < limit and " " not in text:
+            start = bisect.bisect_left(self.words, (text,))
+            for k in range(start, len(self.words)):
+                word, i = self.words[k]
+                if not word.startswith(text) or len(found) >= limit:
+                    break
+                if i not in seen:
+                    found.append((0, self.names[i]))
+                    seen.add(i)
+        
+        #names more than one edit away are only looked for if nothing closer matched
+        for edits in range(1, self.allowedEdits(len(text)) + 1):
+            if len(found) >= limit or (edits > 1 and found):
+                break
+            found.extend(self.fuzzyMatches(text, edits, seen, limit - len(found)))
+        return found
+    
+    #return up to limit (edits, name) pairs for names that aren't in seen and whose start is edits from text, in alphabetical order,
+    #adding their indexes to seen. names fewer edits away have already been found and are in seen
+    def fuzzyMatches(self, text, edits, seen, limit):
+        names = self.names
+        over = edits + 1
+        found = []
+        #each entry is (first, end, depth, row, matched) for the names[first:end] that share a prefix of depth characters. row[j] is the
+        #edit distance between text[:j] and the prefix, or over if it is more than edits. if row[-1] is edits or less the prefix, and so
+        #every name starting with it, matches. entries are pushed in reverse so the names come off in alphabetical order
+        stack = [(0, len(names), 0, [min(j, over) for j in range(len(text) + 1)], False)]
+        while stack and len(found) < limit:
+            first, end, depth, row, matched = stack.pop()
+            if matched:
+                for i in range(first, end):
+                    if i not in seen:
+                        found.append((edits, names[i]))
+                        seen.add(i)
+                        if len(found) >= limit:
+                            break
+                continue
+            
+            #only the cells within edits of the table's diagonal can be edits or less, so only those are worked out
+            prefix = names[first][:depth]
+            i = depth + 1
+            low = max(1, i - edits)
+            high = min(len(text), i + edits)
+            children = []
+            k = first
+            if len(names[k]) == depth:
+                k += 1
+            while k < end:
+                c = names[k][depth]
+                following = bisect.bisect_left(names, prefix + chr(ord(c) + 1), k, end)
+                current = [over]*(len(text) + 1)
+                if i <= edits:
+                    current[0] = i
+                best = current[0]
+                for j in range(low, high + 1):
+                    cost = row[j - 1] if text[j - 1] == c else row[j - 1] + 1
+                    if row[j] < cost:
+                        cost = row[j] + 1
+                    if current[j - 1] < cost:
+                        cost = current[j - 1] + 1
+                    if cost < over:
+                        current[j] = cost
+                        if cost < best:
+                            best = cost
+                #the smallest cell never goes down further along a name, so a prefix with none small enough is a dead end
+                if best <= edits:
+                    children.append((k, following, i, current, current[-1] <= edits))
+                k = following
+            stack.extend(reversed(children))
+        return found
+    
+    #return up to limit stations matching what has been typed so far, best first, as (name, ID) pairs
+    def suggest(self, text, limit = 10):
+        suggestions = []
+        for edits, name in self.matches(self.normalise(text), limit):
+            for ID in self.ids[name]:
+                suggestions.append((self.display[name], ID))
+        return suggestions[:limit]
+    
+    #return the ID of the station that was meant by a name, or None if no station matches or several match equally well.
+    #an exact name is always used, otherwise a name the text is the start of, or a few edits from the start of
+    def resolve(self, text):
+        text = self.normalise(text)
+        if text in self.ids:
+            return self.ids[text][0]
+        found = self.matches(text, 2)
+        if not found or (len(found) == 2 and found[1][0] == found[0][0]) or len(self.ids[found[0][1]]) > 1:
+            return None
+        return self.ids[found[0][1]][0]
+
+
+#//////////////////////////////////////COMMAND LINE//////////////////////////////////////////////
+
+#return the ID of a station given its ID or its name, or what was given if no station matches, so that it is reported as not found
+def stationID(network, station):
+    ID = network.findStation(station)
+    return station if ID is None else ID
+
+#return the routes for a list of (origin, destination) ID pairs, in the same order, as (path, error) pairs where path is what
+#findRoute returns and error is a message if there is no route. the searches from each origin are shared when the mode is dijkstra
+def batchRoutes(network, queries, mode):
+    routes = {}
+    if mode == "dijkstra":
+        byOrigin = OrderedDict()
+        for origin, destination in queries:
+            byOrigin.setdefault(origin, []).append(destination)
+        for origin, destinations in byOrigin.items():
+            for destination, path in network.findRoutes(origin, destinations):
+                routes[(origin, destination)] = path
+    results = []
+    for origin, destination in queries:
+        error = network.routeError(origin, destination)
+        if error is not None:
+            results.append((None, error[0][0]))
+            continue
+        if (origin, destination) in routes:
+            path = routes[(origin, destination)]
+        else:
+            path = network.findRoute(origin, destination, mode)
+        if path is None:
+            results.append((None, "Route not reachable. Check closures"))
+        else:
+            results.append((path, None))
+    return results
+
+#print the earliest arrivals, or the journeys leaving between departure and until if until isn't None, for (origin, destination) ID
+#pairs using the network's timetable. rows are the stations as they were given. returns 0 if every journey was found, 1 if any wasn't
+def timetableRoutes(network, rows, queries, departure, until, asJSON):
+    lineNames = {line: name for name, line in network.lines.items()}
+    failed = False
+    for (origin, destination), (ID1, ID2) in zip(rows, queries):
+        error = network.routeError(ID1, ID2)
+        if error is not None:
+            error = error[0][0]
+        else:
+            if until is None:
+                result = network.earliestArrival(ID1, ID2, departure)
+            else:
+                result = network.departureProfile(ID1, ID2, departure, until)
+            if not result:
+                error = "No journey leaves in time, or the route isn't reachable. Check closures"
+        failed = failed or error is not None
+        if error is not None:
+            print(json.dumps({"origin": origin, "destination": destination, "error": error}) if asJSON else error)
+        elif until is not None:
+            journeys = [(formatTime(leave), formatTime(arrive)) for leave, arrive in result]
+            if asJSON:
+                print(json.dumps({"origin": origin, "destination": destination, "journeys": journeys}))
+            else:
+                for leave, arrive in journeys:
+                    print("leave " + leave + ", arrive " + arrive)
+        else:
+            legs = [{"line": lineNames.get(line, line), "from": network.stations[start].getName(), "departure": formatTime(leave),
+                     "to": network.stations[end].getName(), "arrival": formatTime(arrive)} for line, start, leave, end, arrive in result[0]]
+            if asJSON:
+                print(json.dumps({"origin": origin, "destination": destination, "arrival": formatTime(result[1]), "legs": legs}))
+            else:
+                for leg in legs:
+                    print(leg["departure"] + " " + leg["from"] + " > " + leg["arrival"] + " " + leg["to"] + " (" + leg["line"] + ")")
+                print("Arrive: " + formatTime(result[1]))
+    return 1 if failed else 0
+
+#find routes from the command line. returns the exit status: 0 if every route was found, 1 if any wasn't
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(description = "Find the quickest routes between stations. Stations can be given by name or ID.")
+    parser.add_argument("origin", nargs = "?", help = "the station to start from")
+    parser.add_argument("destination", nargs = "?", help = "the station to go to")
+    parser.add_argument("--batch", metavar = "FILE", help = "find the route for every origin,destination row of a CSV file, or of standard input if FILE is -")
+    parser.add_argument("--network", default = "london", metavar = "PREFIX", help = "load PREFIX.stations.csv, PREFIX.connections.csv and PREFIX.lines.csv, or a snapshot file called PREFIX (default: london)")
+    parser.add_argument("--save-snapshot", metavar = "FILE", help = "save the network, with any closures, as a snapshot that --network can load quickly")
+    parser.add_argument("--mode", default = "dijkstra", choices = ["dijkstra", "astar", "bidirectional", "hierarchy"], help = "the search to use")
+    parser.add_argument("--close-line", action = "append", default = [], metavar = "LINE", help = "close a line, by name or ID. can be repeated")
+    parser.add_argument("--close-station", action = "append", default = [], metavar = "STATION", help = "close a station, by name or ID. can be repeated")
+    parser.add_argument("--json", action = "store_true", help = "write one JSON object per route")
+    parser.add_argument("--timetable", metavar = "FILE", help = "a csv file of service periods or trips, for --depart")
+    parser.add_argument("--depart", metavar = "HH:MM", help = "find the earliest arrival leaving at this time, using --timetable")
+    parser.add_argument("--until", metavar = "HH:MM", help = "with --depart, list every journey worth taking that leaves between --depart and this time")
+    args = parser.parse_args(argv)
+    if args.depart is not None and args.timetable is None:
+        parser.error("--depart needs --timetable")
+    if args.until is not None and args.depart is None:
+        parser.error("--until needs --depart")
+    if (args.batch is not None and args.origin is not None) or (args.batch is None and args.destination is None and (args.save_snapshot is None or args.origin is not None)):
+        parser.error("give an origin and a destination, or --batch")
+    
+    network = loadNetwork(args.network)
+    for name in args.close_line:
+        line = network.lines.get(name, name)
+        if line not in network.lines.values():
+            parser.error("unknown line " + repr(name))
+        if line not in network.closedLines:
+            network.toggleLine(line)
+    for station in args.close_station:
+        ID = stationID(network, station)
+        if ID not in network.stations:
+            parser.error("unknown station " + repr(station))
+        if network.stations[ID].isActive():
+            network.stations[ID].toggleActive()
+    if args.save_snapshot is not None:
+        network.save_snapshot(args.save_snapshot)
+        if args.batch is None and args.origin is None:
+            return 0
+    
+    if args.batch is None:
+        rows = [(args.origin, args.destination)]
+    elif args.batch == "-":
+        rows = [row for row in csv.reader(sys.stdin) if row]
+    else:
+        with open(args.batch, newline = "") as f:
+            rows = [row for row in csv.reader(f) if row]
+    for row in rows:
+        if len(row) < 2:
+            parser.error("batch row " + repr(",".join(row)) + " needs an origin and a destination")
+    rows = [row[:2] for row in rows]
+    queries = [(stationID(network, row[0]), stationID(network, row[1])) for row in rows]
+    if args.depart is not None:
+        network.loadTimetable(args.timetable)
+        return timetableRoutes(network, rows, queries, parseTime(args.depart), None if args.until is None else parseTime(args.until), args.json)
+    results = batchRoutes(network, queries, args.mode)
+    
+    writer = csv.writer(sys.stdout)
+    failed = False
+    for (origin, destination), (path, error) in zip(rows, results):
+        failed = failed or error is not None
+        route = [] if path is None else [network.stations[ID].getName() for ID in path[0]]
+        if args.json:
+            if error is None:
+                print(json.dumps({"origin": origin, "destination": destination, "time": path[1], "route": route}))
+            else:
+                print(json.dumps({"origin": origin, "destination": destination, "error": error}))
+        elif args.batch is not None:
+            writer.writerow([origin, destination, "" if error else path[1], error or " > ".join(route)])
+        elif error is None:
+            for name in route:
+                print(name)
+            print("Total length: " + str(path[1]))
+        else:
+            print(error)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Cross-checks the route finder's faster searches against plain, obviously correct ones under random closures: every findRoute
+search mode, the contraction hierarchy and the repaired shortest path trees against Dijkstra over the stations' own connections, and
+the timetable's connection scans against a brute force over every connection. Run on the London data and on a generated network.
+usage: python -m pytest tests   or   python -m unittest discover tests"""
+import heapq
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+import subway
+import generate
+
+modes = ["dijkstra", "astar", "bidirectional", "hierarchy"]
+
+
+#return the length of the fastest route between two stations, searching the stations' connections directly, or None if there isn't one
+def referenceDistance(network, origin, destination):
+    closed = set(network.closedLines)
+    distance = {origin: 0}
+    queue = [(0, origin)]
+    settled = set()
+    while queue:
+        d, ID = heapq.heappop(queue)
+        if ID in settled:
+            continue
+        settled.add(ID)
+        if ID == destination:
+            return d
+        for neighbour, time, line in network.stations[ID].getConnections():
+            if line in closed or not network.stations[neighbour].isActive():
+                continue
+            if d + int(time) < distance.get(neighbour, d + int(time) + 1):
+                distance[neighbour] = d + int(time)
+                heapq.heappush(queue, (d + int(time), neighbour))
+    return None
+
+#return the earliest arrival at target leaving source at departure, relaxing every open connection until nothing changes
+def referenceArrival(timetable, source, target, departure, closed, active):
+    arrival = {source: departure}
+    changed = True
+    while changed:
+        changed = False
+        for c in range(timetable.size()):
+            i = timetable.sources[c]
+            j = timetable.targets[c]
+            if closed[timetable.lines[c]] or not active[j] or arrival.get(i, timetable.departures[c] + 1) > timetable.departures[c]:
+                continue
+            if timetable.arrivals[c] < arrival.get(j, timetable.arrivals[c] + 1):
+                arrival[j] = timetable.arrivals[c]
+                changed = True
+    return arrival.get(target)
+
+#return the (departure, arrival) journeys from source to target leaving between start and end that no other journey beats. a train
+#leaving source at a time is worth taking if leaving a second later, on any train that day, gets there later
+def referenceProfile(timetable, source, target, start, end, closed, active):
+    times = sorted(set(timetable.departures[c] for c in range(timetable.size()) if timetable.sources[c] == source and
+                       start <= timetable.departures[c] <= end and not closed[timetable.lines[c]]))
+    journeys = []
+    for departure in times:
+        arrival = referenceArrival(timetable, source, target, departure, closed, active)
+        later = referenceArrival(timetable, source, target, departure + 1, closed, active)
+        if arrival is not None and (later is None or arrival < later):
+            journeys.append((departure, arrival))
+    return journeys
+
+
+class CrossCheck:
+    """The checks, run by a test case for each network. network() returns the network to check"""
+    rounds = 25
+    queries = 8
+
+    def setUp(self):
+        self.net = self.network()
+        self.rng = random.Random(7)
+        self.ids = list(self.net.stations)
+        self.lines = list(self.net.getGraph().lineIds)
+
+    #close or open a random line or station
+    def toggle(self):
+        if self.rng.random() < 0.5:
+            self.net.toggleLine(self.rng.choice(self.lines))
+        else:
+            self.net.stations[self.rng.choice(self.ids)].toggleActive()
+
+    #return a random pair of open stations
+    def pair(self):
+        while True:
+            origin = self.rng.choice(self.ids)
+            destination = self.rng.choice(self.ids)
+            if self.net.stations[origin].isActive() and self.net.stations[destination].isActive():
+                return origin, destination
+
+    #check that a route is made of open connections between open stations and takes as long as it says
+    def assertRoute(self, path, origin, destination):
+        route, distance = path
+        self.assertEqual((route[0], route[-1]), (origin, destination))
+        closed = set(self.net.closedLines)
+        total = 0
+        for a, b in zip(route, route[1:]):
+            self.assertTrue(self.net.stations[b].isActive(), "the route passes through closed station " + b)
+            times = [int(time) for neighbour, time, line in self.net.stations[a].getConnections() if neighbour == b and line not in closed]
+            self.assertTrue(times, "the route uses a missing or closed connection from " + a + " to " + b)
+            total += min(times)
+        self.assertEqual(total, distance)
+
+    def testSearchModes(self):
+        self.net.getHierarchy()
+        graph = self.net.getGraph()
+        for round in range(self.rounds):
+            self.toggle()
+            for query in range(self.queries):
+                origin, destination = self.pair()
+                expected = referenceDistance(self.net, origin, destination)
+                for mode in modes:
+                    path = self.net.searchRoute(graph, origin, destination, mode)
+                    self.assertEqual(None if path is None else path[1], expected, mode + " from " + origin + " to " + destination)
+                    if path is not None:
+                        self.assertRoute(path, origin, destination)
+
+    def testDynamicTrees(self):
+        self.net.enableDynamicTrees(capacity = 4, hotThreshold = 1)
+        origins = self.rng.sample(self.ids, 6)
+        for round in range(self.rounds):
+            self.toggle()
+            for query in range(self.queries):
+                origin = self.rng.choice(origins)
+                destination = self.rng.choice(self.ids)
+                if not (self.net.stations[origin].isActive() and self.net.stations[destination].isActive()):
+                    continue
+                path = self.net.findRoute(origin, destination)
+                self.assertEqual(None if path is None else path[1], referenceDistance(self.net, origin, destination))
+                if path is not None:
+                    self.assertRoute(path, origin, destination)
+        self.assertGreater(self.net.dynamicTrees.repairs, 0)
+
+    def testTimetable(self):
+        periods = [(line, 7*3600, 8*3600, 600) for line in self.lines]
+        self.net.timetable = timetable = subway.Timetable.fromFrequencies(self.net, periods)
+        graph = self.net.getGraph()
+        for round in range(self.rounds//2):
+            self.toggle()
+            for query in range(self.queries//2):
+                origin, destination = self.pair()
+                if origin == destination:
+                    continue
+                closed, active = self.net.timetableClosures()
+                source = graph.index[origin]
+                target = graph.index[destination]
+                departure = self.rng.randrange(7*3600, 7*3600 + 1800)
+                journey = self.net.earliestArrival(origin, destination, departure)
+                expected = referenceArrival(timetable, source, target, departure, closed, active)
+                self.assertEqual(None if journey is None else journey[1], expected)
+                if journey is not None:
+                    legs = journey[0]
+                    self.assertEqual((legs[0][1], legs[-1][3], legs[-1][4]), (origin, destination, expected))
+                    self.assertGreaterEqual(legs[0][2], departure)
+                self.assertEqual(self.net.departureProfile(origin, destination, departure, departure + 1200),
+                                 referenceProfile(timetable, source, target, departure, departure + 1200, closed, active))
+
+
+class LondonTest(CrossCheck, unittest.TestCase):
+    def network(self):
+        return subway.loadNetwork(os.path.join(root, "london"))
+
+
+class GeneratedTest(CrossCheck, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(prefix = "subway-test-")
+        cls.prefix = os.path.join(cls.directory, "geometric")
+        generate.writeNetwork(cls.prefix, "geometric", 400, 3)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors = True)
+
+    def network(self):
+        return subway.loadNetwork(self.prefix)
+
+
+if __name__ == "__main__":
+    unittest.main()